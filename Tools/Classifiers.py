@@ -17,13 +17,87 @@ import sys
 import math
 import xgboost
 import os
+import hashlib
+import itertools
+import multiprocessing
+import multiprocessing.sharedctypes
 
 from sklearn.metrics import accuracy_score, f1_score, roc_auc_score, log_loss, precision_score, recall_score
 from sklearn.model_selection import cross_val_score
 
+# joblib moved out of sklearn.externals in newer versions
+try:
+    from sklearn.externals import joblib
+except ImportError:
+    import joblib
+
 import Report as report
 
 
+class SharedDataset( object ):
+
+    """
+    Feature matrix and classes of a sample, converted once and shared by all
+    the models trained or tested on it. The features live in one contiguous
+    (optionally float32) array, and models take their columns from it (see
+    features). With shared=True the arrays are allocated in shared memory,
+    so worker processes can use them without a copy.
+    """
+
+    def __init__( self , data , output_feature=None , ignore_features=[] , dtype=np.float64 , shared=False ):
+        self.output_feature = output_feature
+        self.feature_names  = [col for col in data if col != output_feature and col not in ignore_features]
+        self.index          = data.index
+
+        # Fill the matrix column by column, to avoid a temporary copy of
+        # the whole DataFrame
+        self.matrix = self.allocate( (len(data),len(self.feature_names)) , dtype , shared )
+        for j,c in enumerate(self.feature_names):
+            self.matrix[:,j] = data[c].values
+
+        self.classes = None
+        if output_feature is not None and output_feature in data:
+            values = data[output_feature].values
+            self.classes = self.allocate( values.shape , values.dtype , shared )
+            self.classes[:] = values
+
+    @staticmethod
+    def allocate( shape , dtype , shared ):
+        if not shared:
+            return np.empty( shape , dtype )
+        nbytes = int( np.prod(shape) ) * np.dtype(dtype).itemsize
+        raw = multiprocessing.sharedctypes.RawArray( 'b' , max(nbytes,1) )
+        return np.frombuffer( raw , dtype=dtype , count=int(np.prod(shape)) ).reshape( shape )
+
+    def __len__( self ):
+        return len( self.matrix )
+
+    def digest( self ):
+        # Hash of the features and classes, computed once since every
+        # model on this dataset asks for it (the arrays are not expected
+        # to change after construction)
+        if getattr( self , '_digest' , None ) is None:
+            h = hashlib.sha1()
+            h.update( repr(self.feature_names) + self.matrix.dtype.str + repr(self.matrix.shape) )
+            for i in range( 0 , len(self.matrix) , 65536 ):
+                h.update( self.matrix[i:i+65536].tostring() )
+            if self.classes is not None:
+                h.update( self.classes.dtype.str + self.classes.tostring() )
+            self._digest = h.hexdigest()
+        return self._digest
+
+    def features( self , names=None ):
+        # Columns names of the matrix. This is a view if they are all the
+        # columns or a consecutive run of them, otherwise a copy.
+        if names is None or list(names) == self.feature_names:
+            return self.matrix
+        cols = [ self.feature_names.index(c) for c in names ]
+        if len(cols) > 0 and cols == range( cols[0] , cols[0]+len(cols) ):
+            return self.matrix[:,cols[0]:cols[0]+len(cols)]
+        return self.matrix[:,cols]
+
+
+
 class GenericClassificationModel( object ):
 
     """
@@ -34,7 +108,9 @@ class GenericClassificationModel( object ):
     #
     # Primary purpose of __init__ is to
     # format training and test data into separate sets for dependent
-    # and independent (output_feature) parameters
+    # and independent (output_feature) parameters.
+    # The data can be DataFrames or SharedDatasets; several models built
+    # on the same SharedDatasets share one copy of the feature matrix.
     #
     def __init__( self , training_data , test_data , output_feature , ignore_features , learner ):
 
@@ -46,31 +122,36 @@ class GenericClassificationModel( object ):
 
         # Name of the variable that we would like to predict
         self.output_feature = output_feature
-        self.feature_names  = [col for col in training_data if col != self.output_feature and col not in ignore_features]
 
         # Store the training and test datasets
-        self.training_data = training_data[self.feature_names+[self.output_feature]]
-        self.test_data     = test_data[self.feature_names+[self.output_feature]]
+        if not isinstance( training_data , SharedDataset ):
+            training_data = SharedDataset( training_data , self.output_feature , ignore_features )
+        if test_data is not None and not isinstance( test_data , SharedDataset ):
+            test_data = SharedDataset( test_data , self.output_feature , ignore_features )
+        self.training_data = training_data
+        self.test_data     = test_data
+        self.feature_names = [col for col in training_data.feature_names if col not in ignore_features]
 
         # Isolate the training features and classes
-        self.training_features = training_data[self.feature_names]
-        self.training_classes  = training_data[self.output_feature]
-        self.nclasses          = len( np.unique( self.training_classes.values ) )
+        self.training_features = training_data.features( self.feature_names )
+        self.training_classes  = training_data.classes
+        self.nclasses          = len( np.unique( self.training_classes ) )
 
         # Isolate the test features and classes, but only if the test data
         # was actually included by user
         self.test_classes = None
         self.test_features = None
         if test_data is not None:
-            self.test_features  = test_data[self.feature_names]
-            if self.output_feature in test_data:
-                self.test_classes = test_data[self.output_feature]
-            else:
-                self.test_classes = None
+            self.test_features = test_data.features( self.feature_names )
+            self.test_classes  = test_data.classes
 
         # The learner here is overridden by inheriting classifier
         self.learner = learner
 
+        # Predicted probabilities and classes per dataset, filled on first
+        # use and cleared whenever the learner is retrained
+        self.predictionCache = {}
+
         
     # Overridden by inheriting classifier
     def __str__( self ):
@@ -83,9 +164,52 @@ class GenericClassificationModel( object ):
     def train( self ):
         report.info( "Training %s"%self.__str__() )
         start = time.time()
-        self.learner.fit( self.training_features.values , self.training_classes.values )
+        self.learner.fit( self.training_features , self.training_classes )
         stop = time.time()
         self.traintime = stop - start
+        self.predictionCache = {}
+
+    #
+    # Save the trained learner (by default into outputPath), and load it
+    # back. Loading memory-maps the big arrays of the learner (e.g. the
+    # nodes of tree ensembles) instead of reading them in.
+    #
+    def save( self , path=None ):
+        if path is None:
+            path = "%s/%s.pkl" % (self.outputPath,self.__str__())
+        snapshot = { 'model'          : self.__str__() ,
+                     'feature_names'  : self.feature_names ,
+                     'output_feature' : self.output_feature ,
+                     'traintime'      : self.traintime ,
+                     'learner'        : self.learner }
+        joblib.dump( snapshot , path )
+        return path
+
+    def load( self , path=None ):
+        if path is None:
+            path = "%s/%s.pkl" % (self.outputPath,self.__str__())
+        snapshot = joblib.load( path , mmap_mode='r' )
+        if snapshot['feature_names'] != self.feature_names or snapshot['output_feature'] != self.output_feature:
+            raise ValueError( 'Snapshot %s was trained on different features' % path )
+        self.learner         = snapshot['learner']
+        self.traintime       = snapshot['traintime']
+        self.predictionCache = {}
+        return self
+
+    #
+    # Hash of everything that determines the trained learner: the training
+    # features and classes, the feature list, the model name with its tag,
+    # and the learner settings (apart from thread counts and verbosity)
+    #
+    def fingerprint( self ):
+        h = hashlib.sha1()
+        h.update( self.__str__() )
+        h.update( repr(self.feature_names) )
+        params = self.learner.get_params( deep=False )
+        h.update( repr( sorted( (k,repr(v)) for k,v in params.items() if k not in ['n_jobs','nthread','verbose','silent'] ) ) )
+        # The training data enters through its (cached) dataset hash
+        h.update( self.training_data.digest() )
+        return h.hexdigest()
 
     #
     # Print and return a full ranking of all the features
@@ -109,19 +233,89 @@ class GenericClassificationModel( object ):
                 report.blank( "%50s : %g" % (nf[i], f[i]) )
         return nf
 
+    #
+    # Cached probabilities and predicted classes for dataset 'test' or
+    # 'training'. Each dataset is scored once per training, and the
+    # predicted class is the most probable one.
+    #
+    def probabilities( self , dataset='test' ):
+        if dataset not in self.predictionCache:
+            features = self.test_features if dataset == 'test' else self.training_features
+            self.predictionCache[dataset] = self.learner.predict_proba( features )
+        return self.predictionCache[dataset]
+
+    def predictions( self , dataset='test' ):
+        key = dataset+'_classes'
+        if key not in self.predictionCache:
+            self.predictionCache[key] = self.learner.classes_.take( self.probabilities(dataset).argmax(axis=1) )
+        return self.predictionCache[key]
+
+    def classIndex( self , classvalue ):
+        return np.where( self.learner.classes_==classvalue )[0][0]
+
     #
     #  Functions for producing predicted output for predicted
     # "probability" metrics on test/training data
     #
     def predict( self , elem ): return self.learner.predict(elem)
-    def predict_test( self ): return self.learner.predict( self.test_features )
-    def predict_training( self ): return self.learner.predict( self.training_features )
-    def predict_proba_test( self ): return self.learner.predict_proba( self.test_features )
-    def predict_proba_training( self ): return self.learner.predict_proba( self.training_features )
+    def predict_test( self ): return self.predictions( 'test' )
+    def predict_training( self ): return self.predictions( 'training' )
+    def predict_proba_test( self ): return self.probabilities( 'test' )
+    def predict_proba_training( self ): return self.probabilities( 'training' )
     def predict_proba_for_value( self , classvalue=1 ):
-        full_probas = self.predict_proba_test()
-        classindex  = np.where( self.learner.classes_==classvalue )[0][0]
-        return [ x[classindex] for x in full_probas ]
+        return self.probabilities( 'test' )[ : , self.classIndex(classvalue) ]
+
+    #
+    # Score large samples chunk by chunk, e.g.
+    #     cl.predict_proba_batch( pandas.read_csv( path , chunksize=100000 ) , path='probas.csv' )
+    # data is a DataFrame, SharedDataset, array (with the model's feature
+    # columns) or an iterator over DataFrame/array chunks. The result goes
+    # into out, or a new array, or with path into an .npy file (memory
+    # mapped, needs data of known length) or appended to a CSV file. With
+    # classvalue only the probability of that class is kept. workers > 1
+    # scores the chunks in a process pool. Returns the array, or the path
+    # of a CSV file.
+    #
+    def predict_proba_batch( self , data , chunksize=100000 , out=None , path=None , workers=None , classvalue=None ):
+        column  = None if classvalue is None else self.classIndex( classvalue )
+        ncols   = len(self.learner.classes_) if column is None else 1
+        names   = [ "%s_%s__%s"%(self.outputTag,self.__str__(),str(c)) for c in self.learner.classes_ ]
+        names   = names if column is None else [ names[column] ]
+        tocsv   = path is not None and path.lower().endswith('.csv')
+        shape   = lambda n: (n,) if column is not None else (n,ncols)
+
+        if isinstance( data , (pandas.DataFrame,SharedDataset,np.ndarray) ):
+            nrows  = len(data)
+            chunks = BatchRows( data , self.feature_names , chunksize )
+            if out is None and path is not None and not tocsv:
+                out = np.lib.format.open_memmap( path , mode='w+' , dtype=np.float64 , shape=shape(nrows) )
+            elif out is None and not tocsv:
+                out = np.empty( shape(nrows) )
+        else:
+            if path is not None and not tocsv:
+                raise ValueError( 'Writing .npy files needs data of known length, use a CSV path' )
+            chunks = ( c[self.feature_names].values if isinstance(c,pandas.DataFrame) else c for c in data )
+
+        # Collect the chunks if there is nowhere to put them yet
+        collected = []
+        offset    = 0
+        for res in scoreBatches( self.learner , chunks , column , workers ):
+            if tocsv:
+                pandas.DataFrame( res.reshape(len(res),ncols) , columns=names ).to_csv( path , mode='a' if offset else 'w' ,
+                                                                                       header=(offset==0) , index=False )
+            if out is not None:
+                out[offset:offset+len(res)] = res
+            elif not tocsv:
+                collected += [ res ]
+            offset += len(res)
+
+        if isinstance( out , np.memmap ):
+            out.flush()
+        if out is not None:
+            return out
+        if tocsv:
+            return path
+        return np.concatenate( collected ) if collected else np.empty( shape(0) )
     
     #
     # Return a generic cross validation test score using "cross_val_score"
@@ -129,23 +323,23 @@ class GenericClassificationModel( object ):
     def cross_val_test_score( self , scoring ):
         if self.test_classes is None:
             raise Exception( 'Cant score because test data has undefined output feature' )
-        return cross_val_score( self.learner , self.test_features.values , self.test_classes.values , scoring=scoring )
+        return cross_val_score( self.learner , self.test_features , self.test_classes , scoring=scoring )
 
     #
     # Return generic cross validation training score using "cross_val_score"
     #
     def cross_val_training_score( self , scoring ):
-        return cross_val_score( self.learner , self.training_features.values , self.training_classes.values , scoring=scoring )
+        return cross_val_score( self.learner , self.training_features , self.training_classes , scoring=scoring )
 
     #
     # Some specific metric score functions
     #
-    def accuracy( self ): return accuracy_score( self.test_classes.values , self.predict_test() )
-    def precision( self ): return precision_score( self.test_classes.values , self.predict_test() )
-    def recall( self ): return recall_score( self.test_classes.values , self.predict_test() )
-    def f1score( self ): return f1_score( self.test_classes.values , self.predict_test() )
-    def log_loss( self ): return log_loss( self.test_classes.values , self.predict_proba_test() )
-    def auc( self , classvalue=1): return roc_auc_score( self.test_classes.values , self.predict_proba_for_value(classvalue) )
+    def accuracy( self ): return accuracy_score( self.test_classes , self.predict_test() )
+    def precision( self ): return precision_score( self.test_classes , self.predict_test() )
+    def recall( self ): return recall_score( self.test_classes , self.predict_test() )
+    def f1score( self ): return f1_score( self.test_classes , self.predict_test() )
+    def log_loss( self ): return log_loss( self.test_classes , self.predict_proba_test() )
+    def auc( self , classvalue=1): return roc_auc_score( self.test_classes , self.predict_proba_for_value(classvalue) )
     
     # 
     # Print and return a summary of the training results.
@@ -159,6 +353,7 @@ class GenericClassificationModel( object ):
         if r is not None:
             s += [ "Top 5            = ["+",".join(r[:5])+"]" ]
         s += [ "Training time    = %0.2fs" % self.traintime ]
+        # All the metrics come from the one cached test set scoring
         if self.test_classes is not None:
             s += [ "Accuracy         = %g" % self.accuracy() ]
             s += [ "Precision        = %g" % self.precision() ]
@@ -173,34 +368,44 @@ class GenericClassificationModel( object ):
 
     #
     # Save summary and predictinos to a file so they can be used as input
-    # to another model
+    # to another model. data defaults to the test data, whose cached
+    # probabilities are used.
     #
     def savePredictions( self , data=None , name="predictions" ):
 
         # Create a dictionary of probability predictions for input data
         probas = {}
-        if self.output_feature in data:
-            probas[self.output_feature] = data[self.output_feature].values
-        tmp = self.learner.predict_proba( data[self.feature_names].values )
+        if data is None:
+            if self.test_classes is not None:
+                probas[self.output_feature] = self.test_classes
+            tmp = self.probabilities( 'test' )
+        elif isinstance( data , SharedDataset ):
+            if data.classes is not None:
+                probas[self.output_feature] = data.classes
+            tmp = self.learner.predict_proba( data.features( self.feature_names ) )
+        else:
+            if self.output_feature in data:
+                probas[self.output_feature] = data[self.output_feature].values
+            tmp = self.learner.predict_proba( data[self.feature_names].values )
 
         # Define each feature in the map with a unique name
         for ic,c in enumerate(self.learner.classes_):
             cname = "%s_%s__%s"%(self.outputTag,self.__str__(),str(c))
-            probas[cname] = [ row[ic] for row in tmp ]
+            probas[cname] = tmp[:,ic]
 
         # Save to CSV file
-        pandas.DataFrame(probas).to_csv( "%s/%s_%s.csv"%(self.outputDir,self.__str__(),name) , index=False )
+        pandas.DataFrame(probas).to_csv( "%s/%s_%s.csv"%(self.outputPath,self.__str__(),name) , index=False )
         del probas
         del tmp
 
         # Save a summary file with training info
-        summaryFile = open( "%s/%s_%s_summary.txt" % (self.outputDir,self.__str__(),name) , 'w' )
-        s = summary( quiet=True )
+        summaryFile = open( "%s/%s_%s_summary.txt" % (self.outputPath,self.__str__(),name) , 'w' )
+        s = self.summary( quiet=True )
         for l in s:
             summaryFile.write( l+"\n" )
         summaryFile.close()
 
-        report.info( "Predictions saved to %s" % self.outputDir )
+        report.info( "Predictions saved to %s" % self.outputPath )
 
         
 
@@ -259,7 +464,7 @@ class BDT( GenericClassificationModel ):
 class ExtraRandomForest( GenericClassificationModel ):
     def __init__( self , training_data , test_data=None , output_feature='signal' , ignore_features=[] , \
                   n_estimators=10 , max_features='auto' , max_depth=None , \
-                  min_samples_split=2 , bootstrap=False , verbose=0 ):
+                  min_samples_split=2 , bootstrap=False , verbose=0 , n_jobs=1 ):
 
         self.learner = sklearn.ensemble.ExtraTreesClassifier( random_state = 1, # def = None
                                                               n_estimators = n_estimators, # def = 10
@@ -267,6 +472,7 @@ class ExtraRandomForest( GenericClassificationModel ):
                                                               max_depth = max_depth, # def = None
                                                               min_samples_split = min_samples_split, # def = 2
                                                               bootstrap = bootstrap, # def = False
+                                                              n_jobs = n_jobs, # def = 1
                                                               verbose = verbose )
 
         self.tag = "_".join( [str(n_estimators),str(max_features),str(max_depth),str(min_samples_split),str(bootstrap)] )
@@ -312,3 +518,215 @@ class XGBoost( GenericClassificationModel ):
         return "XGBoost_"+self.tag
         
 
+
+
+#
+# Train several models at once, e.g.
+#     trainModels( my_classifiers , ncores=8 )
+# Every model trains in its own forked worker process and the trained
+# learner and traintime are put back on the original objects, so a sweep
+# takes about as long as its slowest model. Workers find the models in
+# trainQueue by index, so the models and their data are not pickled on
+# the way in.
+#
+trainQueue = []
+
+def threadParams( learner ):
+    # Names of the thread count parameters of learner (n_jobs/nthread)
+    params = learner.get_params( deep=False )
+    return [ p for p in ['n_jobs','nthread'] if p in params and params[p] is not None ]
+
+def splitCores( models , ncores ):
+    # Threads for each model. Single threaded learners take one core each,
+    # the rest of the budget is shared by the multithreaded ones, but
+    # never more than they ask for (n_jobs=-1 asks for everything).
+    threads = [ 1 ] * len(models)
+    multi   = [ i for i,m in enumerate(models) if threadParams(m.learner) ]
+    if len(multi) == 0 or len(models) >= ncores:
+        return threads
+
+    want = {}
+    for i in multi:
+        params = models[i].learner.get_params( deep=False )
+        n = max( params[p] for p in threadParams(models[i].learner) )
+        want[i] = ncores if n < 1 else n
+
+    # Hand out the spare cores one at a time, so they are spread evenly
+    spare = ncores - len(models)
+    while spare > 0:
+        hungry = [ i for i in multi if threads[i] < want[i] ][:spare]
+        if not hungry:
+            break
+        for i in hungry:
+            threads[i] += 1
+        spare -= len(hungry)
+    return threads
+
+def trainQueued( i ):
+    # Executed in the worker process
+    model = trainQueue[i]
+    model.train()
+    return model.learner , model.traintime
+
+def trainModels( models , ncores=None ):
+    if ncores is None:
+        ncores = multiprocessing.cpu_count()
+    threads = splitCores( models , ncores )
+
+    # Remember the thread settings, and set the share of each learner
+    original = []
+    for m,n in zip( models , threads ):
+        params = m.learner.get_params( deep=False )
+        original += [ dict( (p,params[p]) for p in threadParams(m.learner) ) ]
+        m.learner.set_params( **dict( (p,n) for p in original[-1] ) )
+
+    # Put the thread settings back even if a model fails to train
+    try:
+        nproc = min( len(models) , ncores )
+        report.info( "Training %i models in %i processes" % (len(models),nproc) )
+        if nproc <= 1:
+            for m in models:
+                m.train()
+        else:
+            trainQueue[:] = models
+            pool = multiprocessing.Pool( nproc )
+            try:
+                res = pool.map( trainQueued , range(len(models)) , chunksize=1 )
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                trainQueue[:] = []
+            pool.join()
+            for m,(learner,traintime) in zip( models , res ):
+                m.learner         = learner
+                m.traintime       = traintime
+                m.predictionCache = {}
+    finally:
+        for m,params in zip( models , original ):
+            m.learner.set_params( **params )
+    return models
+
+
+
+#
+# Chunked scoring for GenericClassificationModel.predict_proba_batch. The
+# learner and an in-memory sample are left in batchSource for the forked
+# workers, so only row offsets and results are pickled. Chunks from an
+# iterator are handed to the pool one per worker at a time, so memory
+# stays bounded by the number of workers.
+#
+batchSource = []
+
+def scoreArray( learner , X , column ):
+    res = learner.predict_proba( X )
+    return res if column is None else res[:,column]
+
+def scoreRows( args ):
+    # Executed in the worker process
+    start , column = args
+    learner , source = batchSource
+    return scoreArray( learner , source.rows(start) , column )
+
+def scoreChunk( args ):
+    # Executed in the worker process
+    X , column = args
+    return scoreArray( batchSource[0] , X , column )
+
+def scoreBatches( learner , source , column , workers=None ):
+    # Scored chunks of source (BatchRows or an iterator of arrays), in order
+    if workers is None or workers <= 1:
+        for X in source:
+            yield scoreArray( learner , X , column )
+        return
+
+    batchSource[:] = [ learner , source ]
+    pool = multiprocessing.Pool( workers )
+    try:
+        if isinstance( source , BatchRows ):
+            for res in pool.imap( scoreRows , [ (start,column) for start in source.starts ] , chunksize=1 ):
+                yield res
+        else:
+            source = iter( source )
+            while True:
+                group = [ (X,column) for X in itertools.islice( source , workers ) ]
+                if not group:
+                    break
+                for res in pool.map( scoreChunk , group , chunksize=1 ):
+                    yield res
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        batchSource[:] = []
+    pool.join()
+
+class BatchRows( object ):
+
+    # Fixed-size row chunks of a DataFrame, SharedDataset or array,
+    # restricted to the feature columns of model
+
+    def __init__( self , data , feature_names , chunksize ):
+        self.data          = data
+        self.feature_names = feature_names
+        self.chunksize     = chunksize
+        self.starts        = range( 0 , len(data) , chunksize )
+
+    def rows( self , start ):
+        stop = start + self.chunksize
+        if isinstance( self.data , SharedDataset ):
+            return self.data.features( self.feature_names )[start:stop]
+        if isinstance( self.data , pandas.DataFrame ):
+            return self.data.iloc[start:stop][self.feature_names].values
+        return self.data[start:stop]
+
+    def __iter__( self ):
+        for start in self.starts:
+            yield self.rows( start )
+
+
+
+class ModelRegistry( object ):
+
+    """
+    Directory of trained learners, keyed by GenericClassificationModel.fingerprint,
+    so an unchanged configuration is loaded instead of retrained, e.g.
+        registry = ModelRegistry( 'Output/ttReco_models' )
+        registry.trainOrLoad( my_classifiers )
+    """
+
+    def __init__( self , directory ):
+        self.directory = directory
+        if not os.path.isdir( self.directory ):
+            os.makedirs( self.directory )
+
+    def path( self , model ):
+        return os.path.join( self.directory , "%s_%s.pkl" % (model.__str__(),model.fingerprint()[:16]) )
+
+    def __contains__( self , model ):
+        return os.path.isfile( self.path(model) )
+
+    def save( self , model , path=None ):
+        return model.save( path or self.path(model) )
+
+    def load( self , model , path=None ):
+        # Load model from the registry, returns False if it isn't there
+        path = path or self.path( model )
+        if not os.path.isfile( path ):
+            return False
+        model.load( path )
+        report.info( "Loaded %s from %s" % (model.__str__(),path) )
+        return True
+
+    def trainOrLoad( self , models , ncores=None ):
+        # Load what is in the registry, train the rest with trainModels
+        # and store it. The paths are worked out once, before training.
+        paths   = [ self.path(m) for m in models ]
+        missing = [ (m,p) for m,p in zip( models , paths ) if not self.load( m , p ) ]
+        if missing:
+            trainModels( [ m for m,p in missing ] , ncores )
+            for m,p in missing:
+                self.save( m , p )
+        return models
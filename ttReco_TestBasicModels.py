@@ -65,21 +65,28 @@ report.info( "Test size    = " , testSize )
 df_train = df.head( trainSize )
 df_test  = df.tail( testSize )
 
+# Convert the samples once, all classifiers share these matrices.
+# The tree learners work in float32 internally anyway.
+train_set = SharedDataset( df_train , output_feature='signal' , dtype=np.float32 , shared=True )
+test_set  = SharedDataset( df_test , output_feature='signal' , dtype=np.float32 , shared=True )
+
 # Initialize the classifiers that we want to test out
 my_classifiers = [
-    DecisionTree( training_data=df_train , test_data=df_test , output_feature='signal' , ignore_features=ignore_features ) ,
-    BDT( training_data=df_train , test_data=df_test , output_feature='signal' , n_estimators=10 ) ,
-    ExtraRandomForest( training_data=df_train , test_data=df_test , output_feature='signal' , n_estimators=50 ) ,
-    ExtraRandomForest( training_data=df_train , test_data=df_test , output_feature='signal' , n_estimators=100 , ignore_features=ignore_features ) ,
-    XGBoost( training_data=df_train , test_data=df_test , output_feature='signal' , n_estimators=50 ) ,
+    DecisionTree( training_data=train_set , test_data=test_set , output_feature='signal' , ignore_features=ignore_features ) ,
+    BDT( training_data=train_set , test_data=test_set , output_feature='signal' , n_estimators=10 ) ,
+    ExtraRandomForest( training_data=train_set , test_data=test_set , output_feature='signal' , n_estimators=50 ) ,
+    ExtraRandomForest( training_data=train_set , test_data=test_set , output_feature='signal' , n_estimators=100 , ignore_features=ignore_features ) ,
+    XGBoost( training_data=train_set , test_data=test_set , output_feature='signal' , n_estimators=50 ) ,
 ]
 
 #
-# Train each model and dump some performance metrics
+# Train all models at once and dump some performance metrics.
+# Models trained before on the same data and settings are just loaded.
 #
+registry = ModelRegistry( "Output/ttReco_models" )
+registry.trainOrLoad( my_classifiers )
 for cl in my_classifiers:
     print
-    cl.train()
     cl.summary()
     print
     
@@ -0,0 +1,151 @@
+import os
+import numpy as np
+import pandas as pd
+
+import DataLoader
+
+class Catalog( object ):
+
+    """
+    Index of the xeed recordings in a directory, by SUBJECT/LIMB/LABEL (taken
+    from the file names) plus size and recorded time span. The index is kept
+    in <directory>/xeed_catalog.csv and only new or modified files are
+    re-indexed on a scan. Queries are answered from the index alone, and
+    load only decodes the matching files and time ranges, e.g.
+        cat = Catalog( 'Data/xeed' )
+        df  = cat.load( subject='S01' , limb='LA' , label='walk' , duration=pd.Timedelta(minutes=10) )
+    """
+
+    COLUMNS = [ 'PATH' , 'SUBJECT' , 'LIMB' , 'LABEL' , 'SIZE' , 'MTIME' , 'START' , 'STOP' ]
+
+    def __init__( self , directory , indexName='xeed_catalog.csv' , rescan=True ):
+        self.directory = directory
+        self.indexPath = os.path.join( directory , indexName )
+        self.index     = self._load()
+        if rescan:
+            self.scan()
+
+    def _load( self ):
+        if not os.path.isfile( self.indexPath ):
+            return pd.DataFrame( columns=self.COLUMNS )
+        # Keep names such as subject '007' as strings
+        return pd.read_csv( self.indexPath , parse_dates=['START','STOP'] ,
+                            dtype={ 'PATH':str , 'SUBJECT':str , 'LIMB':str , 'LABEL':str } )
+
+    def save( self ):
+        self.index.to_csv( self.indexPath , index=False )
+
+    def scan( self ):
+        # Index every parsable .bin/.csv file, reusing the stored entries of
+        # files whose size and mtime have not changed
+        known = dict( (r['PATH'],r) for i,r in self.index.iterrows() )
+        rows  = []
+        for name in sorted( os.listdir(self.directory) ):
+            path = os.path.join( self.directory , name )
+            if not name.lower().endswith( ('.bin','.csv') ) or path == self.indexPath:
+                continue
+            try:
+                subject , limb , label = DataLoader.parse_filename( path )
+            except ValueError:
+                print 'Skipping %s, file name is not parsable' % path
+                continue
+
+            stat = os.stat( path )
+            old  = known.get( path )
+            if old is not None and old['SIZE'] == stat.st_size and abs( old['MTIME']-stat.st_mtime ) < 1e-3:
+                rows += [ [ old[c] for c in self.COLUMNS ] ]
+                continue
+
+            start , stop = self._span( path )
+            rows += [ [ path , subject , limb , label , stat.st_size , stat.st_mtime , start , stop ] ]
+
+        self.index = pd.DataFrame( rows , columns=self.COLUMNS )
+        self.index['START'] = pd.to_datetime( self.index['START'] )
+        self.index['STOP']  = pd.to_datetime( self.index['STOP'] )
+        self.save()
+        return self.index
+
+    def _span( self , path ):
+        # Time span [start,stop) of a file without decoding its samples
+        if path.lower().endswith('.bin'):
+            # Don't leave packet index files beside the recordings
+            reader = DataLoader.BinReader( path , persist=False )
+            span = ( reader.start , reader.stop )
+            reader.close()
+            return span
+
+        # For CSV files read the first and the last line
+        with open( path , 'r' ) as f:
+            header = f.readline().strip().split(',')
+            first  = f.readline()
+            if not first.strip():
+                return None , None
+            f.seek( 0 , os.SEEK_END )
+            f.seek( max( 0 , f.tell()-4096 ) )
+            last = [ l for l in f.read().splitlines() if l.strip() ][-1]
+        itime = header.index( 'TIME' )
+        times = DataLoader.localize_epoch_ms( [ int(first.split(',')[itime]) , int(last.split(',')[itime]) ] )
+        return pd.Timestamp( times[0] ) , pd.Timestamp( times[1] + np.timedelta64(31250,'us') )
+
+    def query( self , subject=None , limb=None , label=None , start=None , stop=None ):
+        # Rows of the index matching every given field (a value or a list of
+        # values) and overlapping the [start,stop) time range
+        mask = np.ones( len(self.index) , dtype=bool )
+        for col,val in [ ('SUBJECT',subject) , ('LIMB',limb) , ('LABEL',label) ]:
+            if val is None:
+                continue
+            if not isinstance( val , (list,tuple,set) ):
+                val = [ val ]
+            mask &= self.index[col].isin( val ).values
+        if start is not None:
+            mask &= ( self.index['STOP'] > pd.Timestamp(start) ).values
+        if stop is not None:
+            mask &= ( self.index['START'] < pd.Timestamp(stop) ).values
+        return self.index[mask]
+
+    def load( self , subject=None , limb=None , label=None , start=None , stop=None , duration=None ):
+        # Decode only the matching files, and only the requested time range of
+        # each. With duration (a timedelta) the range starts at start, or at
+        # the beginning of each file, e.g. "the first 10 minutes".
+        frames = []
+        for i,r in self.query( subject , limb , label , start , stop ).iterrows():
+            # Files without any samples
+            if pd.isnull( r['START'] ):
+                continue
+            t0 , t1 = start , stop
+            if duration is not None:
+                t0 = r['START'] if start is None else pd.Timestamp(start)
+                t1 = t0 + duration if stop is None else min( pd.Timestamp(stop) , t0+duration )
+
+            df = self._read( r['PATH'] , t0 , t1 )
+            df['SUBJECT'], df['LIMB'], df['LABEL'] = r['SUBJECT'] , r['LIMB'] , r['LABEL']
+            frames += [ df ]
+
+        if len(frames) == 0:
+            return None
+        return pd.concat( frames , ignore_index=True )
+
+    def _read( self , path , t0 , t1 ):
+        if path.lower().endswith('.bin'):
+            reader = DataLoader.BinReader( path , persist=False )
+            df = reader.read( t0 , t1 )
+            reader.close()
+            return df
+
+        # CSV exports can't be addressed by time, but they are time ordered,
+        # so stream them and stop at the first chunk past the range
+        chunks = []
+        with open( path , 'r' ) as f:
+            for df in DataLoader.iterCsvFile( f ):
+                keep = np.ones( len(df) , dtype=bool )
+                if t0 is not None:
+                    keep &= ( df['DATETIME'] >= pd.Timestamp(t0) ).values
+                if t1 is not None:
+                    keep &= ( df['DATETIME'] < pd.Timestamp(t1) ).values
+                chunks += [ df[keep] ]
+                if t1 is not None and df['DATETIME'].iloc[-1] >= pd.Timestamp(t1):
+                    break
+        if len(chunks) == 0:
+            with open( path , 'r' ) as f:
+                return DataLoader.loadCsvFile( f , 0 )
+        return pd.concat( chunks , ignore_index=True )
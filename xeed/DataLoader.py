@@ -1,52 +1,208 @@
 import os
+import mmap
+import hashlib
+import multiprocessing
+import threading
 import numpy as np
 import pandas as pd
 from binascii import hexlify
 from string import digits
 import datetime
 
-def loadWerkFile( f , npoints=None ):
+import DiskCache
+
+# Bump whenever the decoded output of loadBinFile/loadCsvFile changes,
+# so that old entries in the decoded-data cache are not reused
+DECODER_VERSION = 1
+
+# Decoded-data cache used when no cache is passed explicitly. It is
+# switched on by pointing XEED_CACHE_DIR at a directory (XEED_CACHE_GB
+# sets the size cap), or by calling enableCache.
+decodedCache = None
+
+def enableCache( directory , max_gb=2.0 ):
+    global decodedCache
+    decodedCache = DiskCache.ColumnarCache( directory , int(max_gb*1024**3) )
+    return decodedCache
+
+if os.environ.get('XEED_CACHE_DIR'):
+    enableCache( os.environ['XEED_CACHE_DIR'] , float( os.environ.get('XEED_CACHE_GB',2.0) ) )
+
+
+def loadWerkFile( f , npoints=None , cache=None ):
     if f.filename.lower().endswith('.csv'):
-        return loadCsvFile(f,npoints)
+        decode = loadCsvFile
     elif f.filename.lower().endswith('.bin'):
-        return loadBinFile(f,npoints)
+        decode = loadBinFile
     else:
         raise ValueError('File format unknown for file=%s'%f.filename)
 
+    if cache is None:
+        cache = decodedCache
+    if cache is None:
+        return decode(f,npoints)
+
+    # Uploads have no file on disk, so they are cached by a hash of their
+    # content. The stream is read twice, so it has to be seekable.
+    h = hashlib.sha1()
+    for block in iter( lambda: f.read(1<<20) , b'' ):
+        h.update( block )
+    f.seek( 0 )
+    ext = os.path.splitext( f.filename.lower() )[1]
+    key = cache.key( 'upload' , h.hexdigest() , ext , DECODER_VERSION )
+    return lookupCache( cache , key , None , npoints , lambda: decode(f,npoints) )
+
+def loadCached( path , npoints , cache , decode , variant='' ):
+    # Look up the decoded columns of path in the cache, keyed by path, size,
+    # mtime and decoder version, and decode (and store) on a miss. A changed
+    # source file gets a new key, and its stale entry is replaced.
+    if cache is None:
+        cache = decodedCache
+    if cache is None:
+        return decode()
+
+    path = os.path.abspath( path )
+    stat = os.stat( path )
+    key  = cache.key( path , stat.st_size , stat.st_mtime , DECODER_VERSION , variant )
+    return lookupCache( cache , key , path+variant , npoints , decode )
+
+def lookupCache( cache , key , tag , npoints , decode ):
+    # Return the cached frame under key, or decode and store it under key
+    # (replacing older entries with the same tag)
+    df = cache.get( key )
+    if df is not None:
+        if npoints is not None:
+            df = df.iloc[:npoints].reset_index( drop=True )
+        return df
+
+    # Partial loads are not worth storing
+    df = decode()
+    if npoints is None:
+        cache.put( key , df , tag=tag )
+    return df
+
     
-def loadPaths( paths , npoints=None ):
+def loadPaths( paths , npoints=None , workers=None , cache=None , compact=False ):
     # Ensure that input is a list of strings
     if type(paths) is not list:
         raise TypeError('input must be a list of paths')
-    
-    # Load DataFrame for each path in the list
-    res = None
-    for p in paths:
-        if p.lower().endswith('.csv'):
-            with open(p,'r') as f:
-                df = loadCsvFile(f,npoints)
-                df['SUBJECT'], df['LIMB'], df['LABEL'] = parse_filename(p)
-        elif p.lower().endswith('.bin'):
-            with open(p,'r') as f:
-                df = loadBinFile(f,npoints)
-                df['SUBJECT'], df['LIMB'], df['LABEL'] = parse_filename(p)
-        else:
-            raise TypeError('Not sure how to parse this file format')
 
-        # Append this new file worth of data onto our merged dataframe
-        if res is None:
-            res = df
-        else:
-            res = res.append( df , ignore_index=True )
+    # Load DataFrame for each path in the list, either one at a time or
+    # spread over a pool of worker processes
+    if workers is not None and workers > 1 and len(paths) > 1:
+        frames = loadPathsParallel( paths , npoints , workers , cache , compact )
+    else:
+        frames = []
+        for p in paths:
+            df = loadPath( p , npoints , cache , compact )
+            frames.append( df )
 
-        # End the iteration if we've already populated enough rows
-        if npoints is not None:
-            if len(df) >= npoints:
-                df = df.iloc[:npoints]
+            # End the iteration if we've already populated enough rows
+            if npoints is not None and len(df) >= npoints:
                 break
 
-    # Return combined DataFrame
-    return res
+    if len(frames) == 0:
+        return None
+
+    # Merge all of the files in one go
+    if compact:
+        return CompactFrame( concatCompact( [ cf.raw for cf in frames ] ) )
+    return pd.concat( frames , ignore_index=True )
+
+def loadPathsParallel( paths , npoints , workers , cache=None , compact=False ):
+    # Decode files in a process pool, collecting results in input order.
+    # Once a file fills npoints the stop event is set, so every file still
+    # queued is skipped. (Pool.terminate can deadlock in python2 while a
+    # worker is sending back its result, so we close the pool instead.)
+    frames = []
+    stop = multiprocessing.Event()
+    pool = multiprocessing.Pool( min(workers,len(paths)) , initLoadWorker , (stop,) )
+    try:
+        for df in pool.imap( loadPathArgs , [ (p,npoints,cache,compact) for p in paths ] ):
+            frames.append( df )
+            if npoints is not None and len(df) >= npoints:
+                stop.set()
+                break
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    pool.join()
+    return frames
+
+def loadPath( p , npoints=None , cache=None , compact=False ):
+    # Load a single file and tag it with the info stored in its name
+    if p.lower().endswith('.csv'):
+        decode , mode = loadCsvFile , 'r'
+    elif p.lower().endswith('.bin'):
+        decode , mode = loadBinFile , 'rb'
+    else:
+        raise TypeError('Not sure how to parse this file format')
+
+    def decodePath():
+        with open(p,mode) as f:
+            if compact:
+                return decode(f,npoints,compact=True).raw
+            return decode(f,npoints)
+
+    df = loadCached( p , npoints , cache , decodePath , ':compact' if compact else '' )
+    if compact:
+        # Every row of a file shares its tags, so a single category each
+        for c,tag in zip( TAG_COLUMNS , parse_filename(p) ):
+            df[c] = pd.Categorical.from_codes( np.zeros(len(df),dtype=np.int8) , [tag] )
+        return CompactFrame( df )
+    df['SUBJECT'], df['LIMB'], df['LABEL'] = parse_filename(p)
+    return df
+
+loadStop = None
+
+def initLoadWorker( stop ):
+    global loadStop
+    loadStop = stop
+
+def loadPathArgs( args ):
+    # Pool.imap only passes a single argument. Files queued after
+    # npoints has been reached are skipped.
+    if loadStop is not None and loadStop.is_set():
+        return None
+    return loadPath( *args )
+
+def iterPaths( paths , chunk_seconds=60 , npoints=None ):
+    # Generator version of loadPaths, yielding DataFrame chunks of at most
+    # chunk_seconds worth of samples, already tagged with SUBJECT/LIMB/LABEL.
+    # Row-wise steps such as FeatureExtractor.doctor_raw_data can be applied
+    # chunk by chunk, so memory use stays flat no matter how many files.
+    # The npoints logic matches loadPaths, so concatenating all the chunks
+    # gives the same table as loadPaths( paths , npoints ).
+    if type(paths) is not list:
+        raise TypeError('input must be a list of paths')
+
+    nrows = 0
+    for p in paths:
+        nfile = 0
+        for df in iterPath( p , chunk_seconds , npoints ):
+            df.index = pd.RangeIndex( nrows , nrows+len(df) )
+            nrows += len(df)
+            nfile += len(df)
+            yield df
+
+        # End the iteration if we've already populated enough rows
+        if npoints is not None and nfile >= npoints:
+            break
+
+def iterPath( p , chunk_seconds=60 , npoints=None ):
+    if p.lower().endswith('.csv'):
+        it , mode = iterCsvFile , 'r'
+    elif p.lower().endswith('.bin'):
+        it , mode = iterBinFile , 'rb'
+    else:
+        raise TypeError('Not sure how to parse this file format')
+
+    tags = parse_filename(p)
+    with open(p,mode) as f:
+        for df in it( f , chunk_seconds , npoints ):
+            df['SUBJECT'], df['LIMB'], df['LABEL'] = tags
+            yield df
 
 #######################################################################
 # HELPER FUNCTIONS
@@ -54,6 +210,19 @@ def loadPaths( paths , npoints=None ):
 #######################################################################
 
     
+# Layout of a single one-second packet: 6 byte header, 4 byte big-endian
+# start time (epoch seconds), then 32 measurements of 7 big-endian words
+# (Q0,Q1,Q2,Q3,AX,AY,AZ)
+BINSEC_SIZE   = 458
+BINSEC_HEADER = np.array( [0x01,0x00,0x01,0x02,0x03,0x00] , dtype=np.uint8 )
+BINSEC_DTYPE  = np.dtype( [ ('HEADER',np.uint8,(6,)) , ('TIME','>u4') , ('WORDS','>u2',(32,7)) ] )
+MAX_BINSECS   = 32400 # Max time per file set to 9hrs
+
+# Offsets of the 32 measurements inside each one-second packet (31.25 ms steps)
+BINSEC_OFFSETS = np.arange( 32 , dtype=np.int64 ) * np.timedelta64( 31250000 , 'ns' )
+
+BIN_COLUMNS = ['DATETIME','Q0','Q1','Q2','Q3','AX','AY','AZ']
+
 def get_next_binsec( f ):
     s = hexlify( f.read(458) )
 
@@ -85,56 +254,442 @@ def bytepairs_to_measurement( bytes2 , imeasure ):
     avec = [ int_to_a( int(bytes2[i],16) ) for i in range(itr+4,itr+7) ]
     return qvec + avec
 
-def loadBinFile( f , npoints=None ):
+def loadBinFile( f , npoints=None , compact=False ):
 
-    df = pd.DataFrame()
+    # Only read as many one-second packets as we need
+    nmax = MAX_BINSECS
+    if npoints is not None:
+        nmax = min( nmax , -(-npoints//32) )
 
-    timestep = datetime.timedelta( milliseconds=31.25 )
-    
-    for i in xrange(32400): # Max time per file set to 9hrs
-        
-        # Try loading next second
-        try:
-            binsec , good = get_next_binsec( f )
-        except ValueError:
-            print 'Corrupt header found, ending loop over file'
-            break
-        
-        # Break if the load failed because we reached EOF,
-        # or some wierd data formatting
-        if not(good): 
-            break 
-
-        time = binsec_start_time( binsec )
-        
-        # Convert second string to byte pairs
-        bytepairs = binsec_to_bytepairs( binsec )
-        
-        # Convert bytepairs to measurements and append to table
-        df = df.append( [ [time+(im*timestep)] + bytepairs_to_measurement(bytepairs,im) for im in range(32) ] , 
-                        ignore_index=True )
-
-        # End iteration if we've already populated enough rows
-        if npoints is not None:
-            if len(df) >= npoints:
-                df = df.iloc[:npoints]
-                break
+    binsecs = read_binsecs( f.read( nmax*BINSEC_SIZE ) , nmax )
+    if compact:
+        return CompactFrame( binsecs_to_raw( binsecs , npoints ) )
+    return binsecs_to_dataframe( binsecs , npoints )
+
+
+def read_binsecs( buf , nmax=None ):
+    # View a raw buffer as an array of one-second packets (no copy).
+    # Trailing partial packets are ignored and the array is cut at the
+    # first corrupt header, just like the old get_next_binsec loop.
+    n = len(buf) // BINSEC_SIZE
+    if nmax is not None:
+        n = min( n , nmax )
+    binsecs = np.frombuffer( buf , dtype=BINSEC_DTYPE , count=n )
+
+    bad = np.flatnonzero( (binsecs['HEADER'] != BINSEC_HEADER).any(axis=1) )
+    if len(bad) > 0:
+        print 'Corrupt header found, ending loop over file'
+        binsecs = binsecs[:bad[0]]
+    return binsecs
+
+def localize_epoch_ms( ms ):
+    # Vectorized equivalent of datetime.datetime.fromtimestamp for integer
+    # epoch milliseconds, returned as naive local datetime64[ns]. The UTC
+    # offset is only looked up once per 15 minute bucket, which is the
+    # finest granularity of any timezone transition.
+    ms = np.asarray( ms , dtype=np.int64 )
+    buckets , inverse = np.unique( ms // 900000 , return_inverse=True )
+    offsets = np.array( [ int( ( datetime.datetime.fromtimestamp(b*900) - datetime.datetime.utcfromtimestamp(b*900) ).total_seconds() ) * 1000
+                          for b in buckets ] , dtype=np.int64 )
+    local = ms + offsets[inverse]
+    return local.astype( 'datetime64[ms]' ).astype( 'datetime64[ns]' )
 
-    columns = ['DATETIME','Q0','Q1','Q2','Q3','AX','AY','AZ']
-    if len(df)==0:
-        return pd.DataFrame( columns=columns )
+def binsecs_start_times( binsecs ):
+    return localize_epoch_ms( binsecs['TIME'].astype(np.int64) * 1000 )
 
-    df.columns = columns
+def binsecs_to_raw( binsecs , npoints=None ):
+    # Same as binsecs_to_dataframe, but keeping the raw uint16 words and
+    # the timestamps as int64 nanoseconds (see CompactFrame)
+    words = binsecs['WORDS'].reshape(-1,7).astype( np.uint16 )
+    times = ( binsecs_start_times( binsecs )[:,None] + BINSEC_OFFSETS[None,:] ).ravel().view( np.int64 )
+    if npoints is not None:
+        words = words[:npoints]
+        times = times[:npoints]
+
+    df = pd.DataFrame( { 'DATETIME' : times } )
+    for i,c in enumerate(BIN_COLUMNS[1:]):
+        df[c] = words[:,i]
+    return df
+
+def binsecs_to_dataframe( binsecs , npoints=None ):
+    # Decode an array of one-second packets into the standard sensor
+    # DataFrame using array arithmetic (see int_to_q and int_to_a)
+    if len(binsecs) == 0:
+        return pd.DataFrame( columns=BIN_COLUMNS )
+
+    words = binsecs['WORDS'].reshape(-1,7).astype( np.float64 )
+    times = ( binsecs_start_times( binsecs )[:,None] + BINSEC_OFFSETS[None,:] ).ravel()
+    if npoints is not None:
+        words = words[:npoints]
+        times = times[:npoints]
+    if len(times) == 0:
+        return pd.DataFrame( columns=BIN_COLUMNS )
+
+    df = pd.DataFrame( { 'DATETIME' : times } )
+    for i,c in enumerate(BIN_COLUMNS[1:5]):
+        df[c] = ( words[:,i] / 32767.5 ) - 1.0
+    for i,c in enumerate(BIN_COLUMNS[5:]):
+        df[c] = ( words[:,i+4] / 1092.25 ) - 30.0 # in m/s^2
     return df
 
 
-def loadCsvFile( f , npoints=None ):
-    df = pd.read_csv( f , index_col=None , nrows=npoints )
-    df['DATETIME'] = [ datetime.datetime.fromtimestamp(t/1000) + datetime.timedelta(milliseconds=(t%1000))
-                       for t in df['TIME'] ]
+def iterBinFile( f , chunk_seconds=60 , npoints=None ):
+    # Generator version of loadBinFile, decoding chunk_seconds packets at a time
+    nsecs , nrows = 0 , 0
+    while nsecs < MAX_BINSECS:
+        n = min( chunk_seconds , MAX_BINSECS-nsecs )
+        if npoints is not None:
+            n = min( n , -(-(npoints-nrows)//32) )
+        if n <= 0:
+            break
+
+        binsecs = read_binsecs( f.read( n*BINSEC_SIZE ) , n )
+        if len(binsecs) == 0:
+            break
+        df = binsecs_to_dataframe( binsecs , None if npoints is None else npoints-nrows )
+        df.index = pd.RangeIndex( nrows , nrows+len(df) )
+        nsecs += len(binsecs)
+        nrows += len(df)
+        yield df
+
+        # Short read means EOF or a corrupt header
+        if len(binsecs) < n:
+            break
+
+
+class BinReader( object ):
+
+    """
+    Memory-mapped, randomly addressable reader for .bin files.
+    On construction an index of packet byte offsets and start times is
+    built (or loaded from <path>.idx.npz if it is still valid), so that
+    time-range slices only decode the packets overlapping the range, e.g.
+        reader = BinReader( 'Data/S01_LA_walk1.bin' )
+        df = reader[ '2016-10-18 14:13:20' : '2016-10-18 14:18:20' ]
+    Times are naive local datetimes, as in the DATETIME column.
+    """
+
+    def __init__( self , path , persist=True ):
+        self.path  = path
+        self._file = open( path , 'rb' )
+        stat = os.fstat( self._file.fileno() )
+        self.size  = stat.st_size
+        self.mtime = stat.st_mtime
+
+        # mmap refuses to map empty files
+        if self.size > 0:
+            self._mmap = mmap.mmap( self._file.fileno() , 0 , access=mmap.ACCESS_READ )
+        else:
+            self._mmap = b''
+
+        self.indexPath = path + '.idx.npz'
+        if not self._load_index():
+            self._build_index()
+            if persist:
+                self._save_index()
+
+    def _build_index( self ):
+        binsecs      = read_binsecs( self._mmap , MAX_BINSECS )
+        self.offsets = np.arange( len(binsecs) , dtype=np.int64 ) * BINSEC_SIZE
+        self.starts  = binsecs_start_times( binsecs )
+        self.binsecs = binsecs
+
+    def _load_index( self ):
+        if not os.path.isfile( self.indexPath ):
+            return False
+        try:
+            with np.load( self.indexPath ) as idx:
+                if not( int(idx['SIZE']) == self.size and float(idx['MTIME']) == self.mtime ):
+                    return False
+                self.offsets = idx['OFFSET']
+                self.starts  = idx['START']
+        except (IOError,KeyError,ValueError):
+            return False
+        self.binsecs = np.frombuffer( self._mmap , dtype=BINSEC_DTYPE , count=len(self.offsets) )
+        return True
+
+    def _save_index( self ):
+        try:
+            with open( self.indexPath , 'wb' ) as f:
+                np.savez( f , SIZE=self.size , MTIME=self.mtime , OFFSET=self.offsets , START=self.starts )
+        except IOError:
+            print 'Could not write packet index %s' % self.indexPath
+
+    def __len__( self ):
+        return len( self.offsets )
+
+    @property
+    def start( self ):
+        return pd.Timestamp( self.starts[0] ) if len(self) else None
+
+    @property
+    def stop( self ):
+        return pd.Timestamp( self.starts[-1] + np.timedelta64(1,'s') ) if len(self) else None
+
+    def packets( self , t0=None , t1=None ):
+        # Indices of the packets overlapping [t0,t1)
+        mask = np.ones( len(self) , dtype=bool )
+        if t0 is not None:
+            mask &= ( self.starts + np.timedelta64(1,'s') ) > pd.Timestamp(t0).to_datetime64()
+        if t1 is not None:
+            mask &= self.starts < pd.Timestamp(t1).to_datetime64()
+        return np.flatnonzero( mask )
+
+    def read( self , t0=None , t1=None ):
+        df = binsecs_to_dataframe( self.binsecs[ self.packets(t0,t1) ] )
+        if len(df) == 0:
+            return df
+        keep = np.ones( len(df) , dtype=bool )
+        if t0 is not None:
+            keep &= ( df['DATETIME'] >= pd.Timestamp(t0) ).values
+        if t1 is not None:
+            keep &= ( df['DATETIME'] < pd.Timestamp(t1) ).values
+        return df[keep].reset_index( drop=True )
+
+    def __getitem__( self , key ):
+        if not isinstance( key , slice ) or key.step is not None:
+            raise TypeError( 'BinReader only supports time slices, e.g. reader[t0:t1]' )
+        return self.read( key.start , key.stop )
+
+    def close( self ):
+        # Drop views onto the map before closing it
+        self.binsecs = None
+        if self.size > 0:
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self , *args ):
+        self.close()
+
+
+class BinFollower( object ):
+
+    """
+    Follow a .bin file that is still being recorded, decoding each complete
+    packet as soon as it is appended. Partial packets stay buffered until
+    the rest of their bytes arrive. Decoded frames are pushed to every
+    subscriber, e.g.
+        follower = BinFollower( 'Data/S01_LA_live.bin' )
+        follower.subscribe( lambda df: scorer.update( df ) )
+        follower.start()
+    or pulled with a plain loop: for df in follower: ...
+    (asyncio does not exist in python2, so start() polls from a daemon
+    thread and iteration polls in the calling thread.)
+    """
+
+    def __init__( self , path , poll_interval=0.05 , from_start=True ):
+        self.path          = path
+        self.poll_interval = poll_interval
+        self.from_start    = from_start
+        self.subscribers   = []
+        self.nrows         = 0
+        self.corrupt       = False
+        self._file         = None
+        self._buffer       = b''
+        self._thread       = None
+        self._stop         = threading.Event()
+
+    def subscribe( self , callback ):
+        self.subscribers += [ callback ]
+        return callback
+
+    def unsubscribe( self , callback ):
+        self.subscribers.remove( callback )
+
+    def _open( self ):
+        # The recording may not have been created yet
+        try:
+            self._file = open( self.path , 'rb' )
+        except IOError:
+            return False
+        if not self.from_start:
+            # Skip to the last packet boundary already on disk
+            size = os.fstat( self._file.fileno() ).st_size
+            self._file.seek( size - size%BINSEC_SIZE )
+        return True
+
+    def poll( self ):
+        # Decode the complete packets appended since the last poll and
+        # push them to the subscribers. Returns None if nothing is new.
+        if self.corrupt or ( self._file is None and not self._open() ):
+            return None
+        self._buffer += self._file.read()
+        n = len(self._buffer) // BINSEC_SIZE
+        if n == 0:
+            return None
+
+        binsecs = read_binsecs( self._buffer[:n*BINSEC_SIZE] )
+        self._buffer = self._buffer[n*BINSEC_SIZE:]
+        if len(binsecs) < n:
+            # Same policy as loadBinFile, nothing after a bad header is trusted
+            self.corrupt = True
+        if len(binsecs) == 0:
+            return None
+
+        df = binsecs_to_dataframe( binsecs )
+        df.index = pd.RangeIndex( self.nrows , self.nrows+len(df) )
+        self.nrows += len(df)
+        for callback in self.subscribers:
+            callback( df )
+        return df
+
+    def __iter__( self ):
+        # Blocking iteration over newly decoded frames
+        while not( self._stop.is_set() or self.corrupt ):
+            df = self.poll()
+            if df is None:
+                self._stop.wait( self.poll_interval )
+            else:
+                yield df
+
+    def _run( self ):
+        while not( self._stop.is_set() or self.corrupt ):
+            if self.poll() is None:
+                self._stop.wait( self.poll_interval )
+
+    def start( self ):
+        self._stop.clear()
+        self._thread = threading.Thread( target=self._run )
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop( self ):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def close( self ):
+        self.stop()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Explicit dtypes save read_csv from sniffing every column
+CSV_DTYPES = { 'TIME' : np.int64 ,
+               'Q0' : np.float64 , 'Q1' : np.float64 , 'Q2' : np.float64 , 'Q3' : np.float64 ,
+               'AX' : np.float64 , 'AY' : np.float64 , 'AZ' : np.float64 }
+
+def loadCsvFile( f , npoints=None , chunksize=None , compact=False ):
+    if compact:
+        return CompactFrame( compact_dataframe( loadCsvFile( f , npoints , chunksize ) ) )
+
+    # With chunksize set the file is parsed and converted in blocks of rows,
+    # which keeps the parser's working memory bounded for very large exports
+    if chunksize is not None and npoints != 0:
+        return pd.concat( iterCsvFile( f , npoints=npoints , chunksize=chunksize ) )
+    df = pd.read_csv( f , index_col=None , nrows=npoints , dtype=CSV_DTYPES )
+    return csv_to_dataframe( df )
+
+def iterCsvFile( f , chunk_seconds=60 , npoints=None , chunksize=None ):
+    # Generator version of loadCsvFile, reading chunk_seconds*32 rows at a time
+    if chunksize is None:
+        chunksize = chunk_seconds*32
+    for df in pd.read_csv( f , index_col=None , nrows=npoints , dtype=CSV_DTYPES , chunksize=chunksize ):
+        yield csv_to_dataframe( df )
+
+def csv_to_dataframe( df ):
+    # TIME is in epoch milliseconds, converted to local time like fromtimestamp
+    df['DATETIME'] = localize_epoch_ms( df['TIME'].values )
     df.drop( 'TIME' , axis=1 , inplace=True )
     return df
 
+#######################################################################
+# COMPACT STORAGE
+# Raw uint16 words (or float32), int64 timestamps and categorical tags
+#######################################################################
+
+TAG_COLUMNS = ['SUBJECT','LIMB','LABEL']
+
+class CompactFrame( object ):
+
+    """
+    Memory-light version of the sensor DataFrame returned by loadBinFile,
+    loadCsvFile and loadPaths with compact=True. The underlying table (raw)
+    keeps the .bin words as uint16 (CSV values as float32), DATETIME as int64
+    nanoseconds and SUBJECT/LIMB/LABEL as categoricals, about a quarter of
+    the regular memory footprint. int_to_q/int_to_a scaling happens on access:
+        cf = loadPaths( paths , compact=True )
+        cf['Q0']            # float64 Series
+        df = cf.to_frame()  # the regular DataFrame
+    """
+
+    def __init__( self , raw ):
+        self.raw = raw
+
+    def __len__( self ):
+        return len( self.raw )
+
+    @property
+    def columns( self ):
+        return list( self.raw.columns )
+
+    @property
+    def index( self ):
+        return self.raw.index
+
+    def __contains__( self , col ):
+        return col in self.raw
+
+    def __getitem__( self , col ):
+        if isinstance( col , list ):
+            return self.to_frame( col )
+        s = self.raw[col]
+        if col == 'DATETIME':
+            return pd.Series( s.values.view('datetime64[ns]') , index=s.index , name=col )
+        if s.dtype == np.uint16:
+            if col in ['Q0','Q1','Q2','Q3']:
+                return ( s.astype(np.float64) / 32767.5 ) - 1.0
+            return ( s.astype(np.float64) / 1092.25 ) - 30.0 # in m/s^2
+        if s.dtype == np.float32:
+            return s.astype( np.float64 )
+        return s
+
+    def to_frame( self , columns=None ):
+        # Expand to the regular float64 DataFrame (tags stay categorical)
+        if columns is None:
+            columns = self.columns
+        return pd.DataFrame( dict( (c,self[c]) for c in columns ) , index=self.raw.index , columns=columns )
+
+    def memory_usage( self ):
+        return self.raw.memory_usage( index=True , deep=True ).sum()
+
+def compact_dataframe( df ):
+    # Shrink a regular sensor DataFrame, used for CSV files whose values
+    # are not stored as integers
+    raw = pd.DataFrame( index=df.index )
+    for c in df.columns:
+        if c == 'DATETIME':
+            raw[c] = df[c].values.astype( 'datetime64[ns]' ).view( np.int64 )
+        elif c in TAG_COLUMNS:
+            raw[c] = df[c].astype( 'category' )
+        elif df[c].dtype == np.float64:
+            raw[c] = df[c].astype( np.float32 )
+        else:
+            raw[c] = df[c]
+    return raw
+
+def concatCompact( frames ):
+    # pd.concat turns categoricals with different categories into object
+    # columns, so the tags are merged through their codes instead
+    sensors = BIN_COLUMNS[1:]
+    if len( set( df[c].dtype for df in frames for c in sensors if c in df ) ) > 1:
+        # Mixing .bin and .csv files, so store every value as scaled float32
+        frames = [ df.assign( **dict( (c,CompactFrame(df)[c].astype(np.float32)) for c in sensors if c in df ) )
+                   for df in frames ]
+    res = pd.concat( [ df.drop(TAG_COLUMNS,axis=1) for df in frames ] , ignore_index=True )
+    for c in TAG_COLUMNS:
+        categories = sorted( set( x for df in frames for x in df[c].cat.categories ) )
+        codes = [ np.array( [ categories.index(x) for x in df[c].cat.categories ] , dtype=np.int32 )[ df[c].cat.codes.values ]
+                  for df in frames ]
+        res[c] = pd.Categorical.from_codes( np.concatenate(codes) , categories )
+    return res
+
 def parse_filename( fname ):
     f = os.path.basename(fname)
     fhits = f.split('_')
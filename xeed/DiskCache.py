@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+#
+# Size-bounded on-disk store for DataFrames.
+# Every entry is a directory holding one .npy file per column (plus the
+# index), so hits are read straight from the page cache instead of being
+# parsed. The columns are still copied into the returned DataFrame.
+# Sizes, last use and tags of the entries are kept in memory, so a put
+# costs the same however big the store is. The directory is only
+# rescanned (to pick up what other processes wrote) when the running
+# total goes past max_bytes, and entries are then evicted
+# least-recently-used first down to EVICT_TO of max_bytes.
+#
+
+class ColumnarCache( object ):
+
+    EVICT_TO = 0.9
+
+    def __init__( self , directory , max_bytes=2*1024**3 ):
+        self.directory = os.path.expanduser( directory )
+        self.max_bytes = max_bytes
+        if not os.path.isdir( self.directory ):
+            os.makedirs( self.directory )
+        # key -> [nbytes,last use,tag] and tag -> set of keys, filled by
+        # the first scan
+        self._index = None
+        self._tags  = {}
+        self._total = 0
+
+    def __getstate__( self ):
+        # Worker processes build their own index
+        state = self.__dict__.copy()
+        state['_index'] , state['_tags'] , state['_total'] = None , {} , 0
+        return state
+
+    def key( self , *parts ):
+        # Hash an arbitrary list of key ingredients into an entry name
+        return hashlib.sha1( repr(parts).encode('utf-8') ).hexdigest()
+
+    def path( self , key ):
+        return os.path.join( self.directory , key )
+
+    def __contains__( self , key ):
+        return os.path.isfile( os.path.join( self.path(key) , 'meta.json' ) )
+
+    def get( self , key , mmap=True ):
+        # Return the stored DataFrame, or None on a miss
+        entry = self.path( key )
+        try:
+            with open( os.path.join(entry,'meta.json') , 'r' ) as f:
+                meta = json.load( f )
+            index   = self._load_array( entry , 'index' , meta['index_dtype'] , mmap )
+            columns = OrderedDict()
+            for i,(c,dtype) in enumerate( zip(meta['columns'],meta['dtypes']) ):
+                columns[c] = self._load_array( entry , 'col%i'%i , dtype , mmap )
+        except (IOError,OSError,ValueError,KeyError):
+            return None
+
+        # Mark the entry as recently used
+        try:
+            os.utime( entry , None )
+        except OSError:
+            pass
+
+        if self._index is not None and key in self._index:
+            self._index[key][1] = time.time()
+
+        # The names come back from json as unicode
+        names = [ str(c) for c in meta['columns'] ]
+        columns = OrderedDict( (str(c),v) for c,v in columns.items() )
+        index_name = None if meta['index_name'] is None else str( meta['index_name'] )
+        df = pd.DataFrame( columns , index=pd.Index( index , name=index_name ) , columns=names )
+        if meta['range_index']:
+            df.index = pd.RangeIndex( len(df) )
+        return df
+
+    def put( self , key , df , tag=None ):
+        # Store df under key. Any other entry with the same tag (e.g. the
+        # same source file before it changed) is dropped.
+        self._scan()
+        if tag is not None:
+            for other in list( self._tags.get(tag,()) ):
+                if other != key:
+                    self.remove( other )
+
+        tmp = self.path( key ) + '.tmp%i' % os.getpid()
+        if os.path.isdir( tmp ):
+            shutil.rmtree( tmp )
+        os.makedirs( tmp )
+
+        meta = { 'columns'     : [ str(c) for c in df.columns ] ,
+                 'dtypes'      : [ df[c].dtype.str for c in df.columns ] ,
+                 'index_dtype' : df.index.dtype.str ,
+                 'index_name'  : df.index.name ,
+                 'range_index' : isinstance( df.index , pd.RangeIndex ) ,
+                 'tag'         : tag }
+        np.save( os.path.join(tmp,'index.npy') , np.asarray(df.index.values) , allow_pickle=True )
+        for i,c in enumerate(df.columns):
+            np.save( os.path.join(tmp,'col%i.npy'%i) , df[c].values , allow_pickle=True )
+        with open( os.path.join(tmp,'meta.json') , 'w' ) as f:
+            json.dump( meta , f )
+        nbytes = sum( os.path.getsize( os.path.join(tmp,f) ) for f in os.listdir(tmp) )
+
+        # Publish atomically, another process may have beaten us to it. Its
+        # entry then goes into our index, or we would keep missing it.
+        try:
+            os.rename( tmp , self.path(key) )
+        except OSError:
+            shutil.rmtree( tmp , ignore_errors=True )
+            if key not in self:
+                return
+        self._add( key , nbytes , time.time() , tag )
+
+        if self._total > self.max_bytes:
+            self.evict()
+
+    def tagged( self , tag , rescan=False ):
+        # Keys of the entries with tag, biggest first. rescan rereads the
+        # directory first, for when the index is stale (e.g. none of the
+        # keys can be read, as other processes replaced them).
+        self._scan( force=rescan )
+        return sorted( self._tags.get(tag,()) , key=lambda k: -self._index[k][0] )
+
+    def remove( self , key ):
+        shutil.rmtree( self.path(key) , ignore_errors=True )
+        if self._index is not None and key in self._index:
+            nbytes , used , tag = self._index.pop( key )
+            self._total -= nbytes
+            self._tags.get( tag , set() ).discard( key )
+
+    def _add( self , key , nbytes , used , tag ):
+        if key in self._index:
+            old = self._index.pop( key )
+            self._total -= old[0]
+            self._tags.get( old[2] , set() ).discard( key )
+        self._index[key] = [ nbytes , used , tag ]
+        self._total += nbytes
+        if tag is not None:
+            self._tags.setdefault( tag , set() ).add( key )
+
+    def _scan( self , force=False ):
+        # (Re)build the in-memory index from the directory
+        if self._index is not None and not force:
+            return
+        self._index , self._tags , self._total = {} , {} , 0
+        for key,nbytes,used,tag in self.entries():
+            self._add( key , nbytes , used , tag )
+
+    def entries( self ):
+        # List of (key,nbytes,last use,tag) for every complete entry, read
+        # from the directory
+        res = []
+        for key in os.listdir( self.directory ):
+            entry = self.path( key )
+            if '.tmp' in key or key not in self:
+                continue
+            try:
+                nbytes = sum( os.path.getsize( os.path.join(entry,f) ) for f in os.listdir(entry) )
+                with open( os.path.join(entry,'meta.json') , 'r' ) as f:
+                    tag = json.load( f ).get( 'tag' )
+                res += [ (key,nbytes,os.path.getmtime(entry),tag) ]
+            except (IOError,OSError,ValueError):
+                continue
+        return res
+
+    def nbytes( self ):
+        self._scan()
+        return self._total
+
+    def evict( self ):
+        # Drop least recently used entries until we are under EVICT_TO of
+        # max_bytes. Rescan first, other processes share the directory.
+        self._scan( force=True )
+        if self._total <= self.max_bytes:
+            return
+        for key in sorted( self._index , key=lambda k: self._index[k][1] ):
+            if self._total <= self.EVICT_TO*self.max_bytes:
+                break
+            self.remove( key )
+
+    def clear( self ):
+        self._scan( force=True )
+        for key in list( self._index ):
+            self.remove( key )
+
+    def _load_array( self , entry , name , dtype , mmap ):
+        fname = os.path.join( entry , name+'.npy' )
+        # Object arrays are pickled and can't be memory-mapped
+        if mmap and np.dtype(dtype).kind != 'O':
+            return np.load( fname , mmap_mode='r' )
+        return np.load( fname , allow_pickle=True )
@@ -1,9 +1,15 @@
+import os
+import hashlib
 import numpy as np
 import pandas as pd
 import progressbar as pb
 import datetime
+import multiprocessing
+from fractions import gcd
+from collections import OrderedDict
 
 import Quaternions
+import DiskCache
 
 #
 # Helper functions for extracting features from dataset using sliding window
@@ -12,23 +18,57 @@ import Quaternions
 #freqbins = [ (0.0,0.5) , (0.5,1.0) , (1.0,2.0) , (2.0,4.0) , (4.0,8.0) , (8.0,16.001) ]
 freqbins = [ (0.0,0.8) , (0.8,2.0) , (2.0,4.0) , (4.0,8.0) , (8.0,16.001) ]
 
-def limbfeatures( df , suffix='' ):
+# Signals that get window features in limbfeatures
+#limbsignals = ['Q0','Q1','Q2','Q3','AMAG','ATRAN','AZ','PHI','THETA','PSI','AZQ','ATRANQ','XYANGLE']
+limbsignals = [ 'AMAG' , 'AZ' , 'ATRAN' , 'AZQ' , 'ATRANQ' , 'XYANGLE' ]
+
+#
+# Optional on-disk store of computed window features, e.g.
+#     FeatureExtractor.enableFeatureStore( '~/.xeed_features' , max_gb=10 )
+# or set XEED_FEATURE_DIR (and XEED_FEATURE_GB). There is one entry per
+# input signal, N and hop, tagged by a fingerprint of the signal, its name,
+# N, hop and FEATURE_VERSION, so bump FEATURE_VERSION whenever the feature
+# code changes its output. The entry holds every feature computed so far
+# (FFTP bands under their band edges), so a new band or signal only
+# computes what is missing, and the entry is then rewritten with it.
+#
+FEATURE_VERSION = 1
+
+featureStore = None
+
+def enableFeatureStore( directory , max_gb=2.0 ):
+    global featureStore
+    featureStore = DiskCache.ColumnarCache( directory , int(max_gb*1024**3) )
+    return featureStore
+
+if os.environ.get('XEED_FEATURE_DIR'):
+    enableFeatureStore( os.environ['XEED_FEATURE_DIR'] , float( os.environ.get('XEED_FEATURE_GB',2.0) ) )
+
+def limbfeatures( df , suffix='' , workers=None , N=128 , hop=None , ffill=False , max_gap=None , store=None , extra_features=False ):
     global freqbins
 
-    df_features = df.copy()
-    df_features.set_index( 'DATETIME' , inplace=True )
+    # With max_gap (a timedelta, or seconds) the recording is cut at every
+    # gap longer than that, and each segment gets its own time grid. Windows
+    # never span such a gap anyway, so only the grid rows inside the gaps
+    # are lost, which saves a lot on recordings with long pauses.
+    segments = [ fill_timeseries( seg ) for seg in split_segments( df , max_gap ) ]
 
-    # Fill in the missing times
-    timeseries = pd.date_range( df_features.index.min() , df_features.index.max() , freq=datetime.timedelta(milliseconds=31.25) )
-    df_timeseries = pd.DataFrame( index=timeseries )
-    df_features = df_timeseries.join( df_features , how='left' , sort=True )
+    # Compute a bunch of window features with 5s window. Signals are
+    # independent, so with workers > 1 they are spread over a process pool.
+    # Either way the new columns are attached in a single concat.
+    # N can also be a list of window lengths, e.g. (64,128,480), which
+    # are then computed together by multiscale_window_features.
+    # With hop the windows are only evaluated every hop rows (see
+    # attach_features for the layout of the output). extra_features adds
+    # the crossing/peak/periodicity features of window_shape_features.
+    # With a feature store (store, or the one from enableFeatureStore)
+    # features computed before are read back instead.
+    tasks   = [ (seg[fname],N,freqbins,hop,store,extra_features) for seg in segments for fname in limbsignals ]
+    results = run_tasks( signal_features , tasks , workers )
 
-    # Compute a bunch of window features with 5s window
-    N = 128
-    #for fname in ['Q0','Q1','Q2','Q3','AMAG','ATRAN','AZ','PHI','THETA','PSI','AZQ','ATRANQ','XYANGLE']:
-    for fname in [ 'AMAG' , 'AZ' , 'ATRAN' , 'AZQ' , 'ATRANQ' , 'XYANGLE' ]:
-        print 'Computing features for', fname, N
-        df_features = add_window_features( df_features , fname , N , freqbins )
+    nsig = len(limbsignals)
+    frames = [ attach_features( seg , results[i*nsig:(i+1)*nsig] , hop , ffill ) for i,seg in enumerate(segments) ]
+    df_features = frames[0] if len(frames) == 1 else pd.concat( frames )
 
     # Create a Sum(fft) summing over all quaternions
     #for w in range(len(freqbins)):
@@ -47,34 +87,487 @@ def limbfeatures( df , suffix='' ):
     #for fname in ['PSI']:
     #    print 'Rolling features for', fname, N
     #    df_features = add_window_features( df_features , fname , N , freqbins )
-        
+
+    # Tell the limbs apart once they are joined (see align_limbs)
+    if suffix:
+        df_features = df_features.add_suffix( suffix )
+
     return df_features
     
     
-def add_window_features( df , fname , N , freqbins ):
+def cohortfeatures( df , workers=None , N=128 , hop=None , ffill=False , max_gap=None , store=None , extra_features=False ):
+    # limbfeatures for a multi-file load (e.g. from DataLoader.loadPaths).
+    # Every (SUBJECT,LIMB) group (and with max_gap every segment of it) is
+    # put on its own time grid, then the window features of all groups and
+    # signals are computed as independent tasks.
+    global freqbins
+
+    keys   = [ k for k in ['SUBJECT','LIMB'] if k in df ]
+    groups = []
+    for key,group in ( df.groupby(keys,sort=False) if keys else [ (None,df) ] ):
+        for seg in split_segments( group , max_gap ):
+            g = fill_timeseries( seg )
+            # Rows added on the grid belong to this group too
+            for k,v in zip( keys , key if isinstance(key,tuple) else [key] ):
+                g[k] = v
+            groups += [ g ]
+
+    tasks   = [ (g[fname],N,freqbins,hop,store,extra_features) for g in groups for fname in limbsignals ]
+    results = run_tasks( signal_features , tasks , workers )
+
+    nsig = len(limbsignals)
+    return pd.concat( [ attach_features( g , results[i*nsig:(i+1)*nsig] , hop , ffill ) for i,g in enumerate(groups) ] )
+
+def subjectfeatures( df , tolerance=datetime.timedelta(milliseconds=15.625) , **kwargs ):
+    # One wide feature frame per SUBJECT of a multi-limb load (e.g. from
+    # DataLoader.loadPaths): limbfeatures of every limb with the suffix
+    # _<LIMB>, aligned onto the time base of the first limb with
+    # align_limbs. Further arguments are passed on to limbfeatures.
+    res = []
+    for subject,g in df.groupby( 'SUBJECT' , sort=False ):
+        limbs = [ limbfeatures( lg.drop( ['SUBJECT','LIMB'] , axis=1 ) , suffix='_'+limb , **kwargs )
+                  for limb,lg in g.groupby( 'LIMB' , sort=False ) ]
+        wide = align_limbs( limbs , tolerance=tolerance )
+        wide['SUBJECT'] = subject
+        res += [ wide ]
+    return pd.concat( res )
+
+def align_limbs( frames , base=None , tolerance=datetime.timedelta(milliseconds=15.625) ):
+    # Join the time indexed frames of several limbs side by side. Every row
+    # of the common time base (base, or the index of the first frame) gets
+    # the nearest row of each frame, or NaN if that is further away than
+    # tolerance. frames is a list of frames with distinct column names
+    # (e.g. from limbfeatures with a suffix), or a dict {suffix:frame}.
+    if isinstance( frames , dict ):
+        frames = [ f.add_suffix( k ) for k,f in sorted( frames.items() ) ]
+    if base is None:
+        base = frames[0].index
+    targets = np.asarray( base.values , dtype='datetime64[ns]' ).view( np.int64 )
+    tol     = pd.Timedelta( tolerance ).value
+
+    aligned = []
+    for f in frames:
+        if not f.index.is_monotonic_increasing:
+            f = f.sort_index()
+        times = np.asarray( f.index.values , dtype='datetime64[ns]' ).view( np.int64 )
+        pos   = nearest_positions( times , targets )
+        if len(times) > 0:
+            pos[ np.abs( times[pos]-targets ) > tol ] = -1
+        # Reindexing by position leaves NaN rows where there is no match
+        f = f.reset_index( drop=True ).reindex( pos )
+        f.index = base
+        aligned += [ f ]
+    return pd.concat( aligned , axis=1 )
+
+def nearest_positions( times , targets ):
+    # Position of the closest entry of the sorted times to every target,
+    # -1 everywhere if times is empty
+    if len(times) == 0:
+        return np.full( len(targets) , -1 , dtype=np.int64 )
+    right = np.searchsorted( times , targets ).clip( 1 , max(len(times)-1,1) )
+    left  = right - 1
+    if len(times) == 1:
+        return np.zeros( len(targets) , dtype=np.int64 )
+    return np.where( targets-times[left] <= times[right]-targets , left , right )
+
+def attach_features( df_features , frames , hop=None , ffill=False ):
+    # Join the feature frames onto the gridded data in one go. Features
+    # evaluated with a hop are indexed at the window centres; the output
+    # then keeps only those rows, or with ffill the features are carried
+    # forward over the rows in between.
+    if hop is None or hop <= 1:
+        return pd.concat( [df_features] + frames , axis=1 )
+    if ffill:
+        return pd.concat( [df_features] + [ f.reindex( df_features.index , method='ffill' ) for f in frames ] , axis=1 )
+    return pd.concat( [ df_features.iloc[::hop] ] + frames , axis=1 )
+
+def fill_timeseries( df ):
+    # Index by DATETIME and fill in the missing times on the 31.25 ms grid
+    df_features = df.copy()
+    df_features.set_index( 'DATETIME' , inplace=True )
+    timeseries = pd.date_range( df_features.index.min() , df_features.index.max() , freq=datetime.timedelta(milliseconds=31.25) )
+    df_timeseries = pd.DataFrame( index=timeseries )
+    return df_timeseries.join( df_features , how='left' , sort=True )
+
+def split_segments( df , max_gap=None ):
+    # Split df into time ordered pieces wherever DATETIME jumps by more
+    # than max_gap (a timedelta, or seconds). Returns [df] if max_gap is None.
+    if max_gap is None or len(df) == 0:
+        return [ df ]
+    if not isinstance( max_gap , (datetime.timedelta,np.timedelta64) ):
+        max_gap = datetime.timedelta( seconds=max_gap )
+    df = df.sort_values( 'DATETIME' )
+    jumps = np.flatnonzero( np.diff( df['DATETIME'].values ) > np.timedelta64( pd.Timedelta(max_gap) ) ) + 1
+    bounds = [0] + list(jumps) + [len(df)]
+    return [ df.iloc[a:b] for a,b in zip( bounds[:-1] , bounds[1:] ) ]
+
+def run_tasks( func , tasks , workers=None ):
+    # Map func over tasks, in a process pool if workers > 1
+    if workers is None or workers <= 1 or len(tasks) <= 1:
+        return [ func(t) for t in tasks ]
+    pool = multiprocessing.Pool( min(workers,len(tasks)) )
+    try:
+        res = pool.map( func , tasks , chunksize=1 )
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    pool.join()
+    return res
+
+def signal_features( args ):
+    # Pool.map only passes a single argument
+    s , N , freqbins , hop , store , extra = args
+    if store is None:
+        store = featureStore
+    if store is not None:
+        Ns = N if isinstance( N , (list,tuple) ) else [ N ]
+        return pd.concat( [ stored_window_features( s , n , freqbins , hop , store , extra ) for n in Ns ] , axis=1 )
+    print 'Computing features for', s.name, N
+    if not isinstance( N , (list,tuple) ):
+        return window_features( s , N , freqbins , hop , extra=extra )
+    if hop is None or hop <= 1:
+        res = multiscale_window_features( s , N , freqbins )
+        if not extra:
+            return res
+        return pd.concat( [res] + [ window_features( s , n , freqbins , stats=False , bands=[] , extra=True ) for n in N ] , axis=1 )
+    # Strided evaluation already skips most of the work
+    return pd.concat( [ window_features( s , n , freqbins , hop , extra=extra ) for n in N ] , axis=1 )
+
+def add_window_features( df , fname , N , freqbins , hop=None , extra=False , ffill=False ):
+    # Add the window features of df[fname] to df. With hop > 1 the rows are
+    # handled as in attach_features: the result is a new frame holding only
+    # the window centre rows, or with ffill the features are carried
+    # forward over the rows in between, and added to df itself.
+    features = window_features( df[fname] , N , freqbins , hop , extra=extra )
+    if hop is not None and hop > 1:
+        if not ffill:
+            return attach_features( df , [features] , hop )
+        features = attach_features( df[[]] , [features] , hop , ffill=True )
+    for c in features:
+        df[c] = features[c]
+    return df
+
+def window_features( s , N , freqbins , hop=None , stats=True , bands=None , extra=False ):
+    # Window features of the Series s, returned as a new DataFrame.
+    # With hop > 1 only the windows centred on every hop-th row are
+    # evaluated, and the frame is indexed by those rows. stats=False skips
+    # MEAN..SKEW, bands selects a subset of the FFTP bands by number, and
+    # extra adds the window_shape_features columns at the end.
+    fname = s.name
     # Determine indices of bin boundaries
     freqiters = get_freqiters( freqbins , N )
-    # Create a rolling window object
-    roll = df[fname].rolling( min_periods=N , window=N , center=True )
-    # All the dirty work here
-    df['MEAN_%s_%i'%(fname,N)] = roll.mean()
-    df['STD_%s_%i'%(fname,N)] = roll.std()
-    df['MAX_%s_%i'%(fname,N)] = roll.max()
-    df['MIN_%s_%i'%(fname,N)] = roll.min()
-    df['MED_%s_%i'%(fname,N)] = roll.median()
-    df['RANGE_%s_%i'%(fname,N)] = roll.apply( lambda x: x.max()-x.min() )
-    df['SKEW_%s_%i'%(fname,N)] = roll.skew()
-    #df['SUM_%s_%i'%(fname,N)] = roll.sum() / float(N)
-    for ifreq,freq in enumerate(freqiters):
-        df['FFTP_W%i_%s_%i'%(ifreq,fname,N)] = roll.apply( lambda x: np.abs(np.fft.rfft(x))[freq[0]].sum() / freq[1] )
-    return df
+    if bands is None:
+        bands = range( len(freqiters) )
+    if hop is not None and hop > 1:
+        return strided_window_features( s , N , freqiters , hop , stats , bands , extra )
+    res = OrderedDict()
+    if stats:
+        # Create a rolling window object
+        roll = s.rolling( min_periods=N , window=N , center=True )
+        # All the dirty work here
+        res['MEAN_%s_%i'%(fname,N)] = roll.mean()
+        res['STD_%s_%i'%(fname,N)] = roll.std()
+        res['MAX_%s_%i'%(fname,N)] = roll.max()
+        res['MIN_%s_%i'%(fname,N)] = roll.min()
+        res['MED_%s_%i'%(fname,N)] = roll.median()
+        res['RANGE_%s_%i'%(fname,N)] = res['MAX_%s_%i'%(fname,N)] - res['MIN_%s_%i'%(fname,N)]
+        res['SKEW_%s_%i'%(fname,N)] = roll.skew()
+        #res['SUM_%s_%i'%(fname,N)] = roll.sum() / float(N)
+    # All of the frequency bands come from one batched FFT
+    if len(bands) > 0:
+        powers = window_fft_powers( s.values , N , [ freqiters[i] for i in bands ] )
+        for k,ifreq in enumerate(bands):
+            res['FFTP_W%i_%s_%i'%(ifreq,fname,N)] = powers[:,k]
+    if extra:
+        for k,v in window_shape_features( s.values , N ).items():
+            res['%s_%s_%i'%(k,fname,N)] = v
+    return pd.DataFrame( res , index=s.index , columns=res.keys() )
+
+def strided_window_features( s , N , freqiters , hop , stats=True , bands=None , extra=False ):
+    # window_features evaluated at rows 0,hop,2*hop,... directly on the
+    # strided windows, so the cost drops by the hop factor
+    fname = s.name
+    x     = s.values.astype( np.float64 )
+    rows  = np.arange( 0 , len(x) , hop )
+    if bands is None:
+        bands = range( len(freqiters) )
+    res = OrderedDict()
+    if stats:
+        res.update( strided_window_stats( x , N , rows ) )
+    res = OrderedDict( ('%s_%s_%i'%(k,fname,N),v) for k,v in res.items() )
+    if len(bands) > 0:
+        powers = window_fft_powers( x , N , [ freqiters[i] for i in bands ] , hop=hop )
+        for k,ifreq in enumerate(bands):
+            res['FFTP_W%i_%s_%i'%(ifreq,fname,N)] = powers[:,k]
+    if extra:
+        for k,v in window_shape_features( x , N , hop ).items():
+            res['%s_%s_%i'%(k,fname,N)] = v
+    return pd.DataFrame( res , index=s.index[rows] , columns=res.keys() )
+
+def strided_window_stats( x , N , rows ):
+    # MEAN..SKEW of the windows centred on rows, NaN where incomplete
+    stats = OrderedDict( (k,np.full(len(rows),np.nan)) for k in ['MEAN','STD','MAX','MIN','MED','RANGE','SKEW'] )
+
+    windows = sliding_windows( x , N )
+    starts  = rows - N//2
+    inside  = np.flatnonzero( (starts >= 0) & (starts < len(windows)) )
+    for b in range(0,len(inside),4096):
+        sel = inside[b:b+4096]
+        w   = windows[ starts[sel] ]
+        # Windows with missing values stay NaN, as for min_periods=N
+        good = ~np.isnan(w).any( axis=1 )
+        w , sel = w[good] , sel[good]
+        mean = w.mean( axis=1 )
+        dev  = w - mean[:,None]
+        m2   = (dev*dev).mean( axis=1 )
+        m3   = (dev*dev*dev).mean( axis=1 )
+        stats['MEAN'][sel]  = mean
+        stats['STD'][sel]   = np.sqrt( m2 * N / (N-1.0) )
+        stats['MAX'][sel]   = w.max( axis=1 )
+        stats['MIN'][sel]   = w.min( axis=1 )
+        stats['MED'][sel]   = np.median( w , axis=1 )
+        stats['RANGE'][sel] = stats['MAX'][sel] - stats['MIN'][sel]
+        with np.errstate( invalid='ignore' , divide='ignore' ):
+            stats['SKEW'][sel] = np.where( m2 > 0 , np.sqrt(N*(N-1.0)) * m3 / ( (N-2) * m2**1.5 ) , np.nan )
+    return stats
+
+def fingerprint( s ):
+    # Hash of the values, index and name of the Series s
+    h = hashlib.sha1()
+    h.update( str(s.name).encode('utf-8') )
+    h.update( s.values.dtype.str.encode('utf-8') )
+    h.update( np.ascontiguousarray( s.values ).tostring() )
+    h.update( np.ascontiguousarray( s.index.values ).tostring() )
+    return h.hexdigest()
+
+def stored_window_features( s , N , freqbins , hop , store , extra=False ):
+    # window_features looked up in the feature store. Stored columns are
+    # named by what they hold (band edges for FFTP), the missing ones are
+    # computed together and the entry is replaced by the union.
+    hop = None if hop is None or hop <= 1 else hop
+    tag = store.key( 'features' , FEATURE_VERSION , fingerprint(s) , s.name , N , hop )
+
+    # Output column for every stored name
+    names = OrderedDict( (k,'%s_%s_%i'%(k,s.name,N)) for k in ['MEAN','STD','MAX','MIN','MED','RANGE','SKEW'] )
+    bands = OrderedDict( ('FFTP_%r_%r'%tuple(b),'FFTP_W%i_%s_%i'%(i,s.name,N)) for i,b in enumerate(freqbins) )
+    shape = OrderedDict( (k,'%s_%s_%i'%(k,s.name,N)) for k in ( SHAPE_FEATURES if extra else [] ) )
+    names.update( bands )
+    names.update( shape )
+
+    # If none of the entries we know of can be read, other processes (e.g.
+    # limbfeatures workers) have replaced them, so look again
+    stored = None
+    for rescan in [ False , True ]:
+        keys = store.tagged( tag , rescan )
+        for key in keys:
+            stored = store.get( key )
+            if stored is not None:
+                break
+        if stored is not None or len(keys) == 0:
+            break
+    have = set() if stored is None else set( stored.columns )
+
+    missing = [ k for k in names if k not in have ]
+    if len(missing) > 0:
+        print 'Computing features for', s.name, N
+        new = window_features( s , N , freqbins , hop , stats=any( k in missing for k in ['MEAN','STD','MAX','MIN','MED','RANGE','SKEW'] ) ,
+                               bands=[ i for i,k in enumerate(bands) if k in missing ] , extra=any( k in missing for k in shape ) )
+        new = pd.DataFrame( OrderedDict( (k,new[names[k]].values) for k in missing ) , index=new.index , columns=missing )
+        stored = new if stored is None else pd.concat( [ stored.set_index(new.index) , new ] , axis=1 )
+        store.put( store.key( tag , sorted(stored.columns) ) , stored , tag=tag )
+
+    res = pd.DataFrame( OrderedDict( (names[k],stored[k].values) for k in names ) , columns=names.values() )
+    res.index = s.index if hop is None else s.index[::hop]
+    return res
+
+def multiscale_window_features( s , Ns , freqbins ):
+    # window_features for several window lengths at once, sharing the work
+    # between scales: one set of prefix sums gives MEAN/STD/SKEW for every N,
+    # one pass of doubling window extremes gives MAX/MIN for every N, and
+    # multiscale_fft_powers gives FFTP_* with one sliding DFT per distinct
+    # frequency across all N. Only MED is still a separate rolling median
+    # per N. Values agree with window_features up to floating point
+    # rounding (MED is identical).
+    fname  = s.name
+    x      = s.values.astype( np.float64 )
+    n      = len(x)
+    isnan  = np.isnan( x )
+
+    # Prefix sums of the NaN count and of powers of the centred values
+    d = np.where( isnan , 0.0 , x - ( np.nanmean(x) if not isnan.all() else 0.0 ) )
+    def prefix( v ):
+        return np.concatenate( [ [0.0] , np.cumsum(v) ] )
+    pnan , p1 , p2 , p3 = prefix( isnan ) , prefix( d ) , prefix( d*d ) , prefix( d*d*d )
+
+    # Maxima/minima of power-of-two windows, built by doubling. A window of
+    # length N is covered by two overlapping windows of the largest power
+    # of two k <= N, so each scale is read off while passing through k.
+    extremes = {}
+    powers = multiscale_fft_powers( d , Ns , freqbins )
+    vmax , vmin , k = x , x , 1
+    for N in sorted( set(Ns) ):
+        while 2*k <= N:
+            vmax = np.maximum( vmax[:-k] , vmax[k:] )
+            vmin = np.minimum( vmin[:-k] , vmin[k:] )
+            k *= 2
+        nwin = max( n-N+1 , 0 )
+        extremes[N] = ( np.maximum( vmax[:nwin] , vmax[N-k:N-k+nwin] ) ,
+                        np.minimum( vmin[:nwin] , vmin[N-k:N-k+nwin] ) )
+
+    res = OrderedDict()
+    for N in Ns:
+        nwin  = max( n-N+1 , 0 )
+        rows  = slice( N//2 , N//2+nwin )
+        valid = ( pnan[N:] - pnan[:nwin] ) == 0
+
+        def centred( v ):
+            out = np.full( n , np.nan )
+            out[rows] = np.where( valid , v , np.nan )
+            return out
+
+        S1 = p1[N:] - p1[:nwin]
+        S2 = p2[N:] - p2[:nwin]
+        S3 = p3[N:] - p3[:nwin]
+        A  = S1/N
+        B  = S2/N - A*A
+        C  = S3/N - A*A*A - 3*A*B
+        with np.errstate( invalid='ignore' , divide='ignore' ):
+            skew = np.where( B > 0 , np.sqrt(N*(N-1.0)) * C / ( (N-2) * np.abs(B)**1.5 ) , np.nan )
+        vmaxN , vminN = extremes[N]
+
+        res['MEAN_%s_%i'%(fname,N)]  = centred( np.nanmean(x) + A if not isnan.all() else A )
+        res['STD_%s_%i'%(fname,N)]   = centred( np.sqrt( np.maximum( (S2 - S1*S1/N) / (N-1) , 0.0 ) ) )
+        res['MAX_%s_%i'%(fname,N)]   = centred( vmaxN )
+        res['MIN_%s_%i'%(fname,N)]   = centred( vminN )
+        res['MED_%s_%i'%(fname,N)]   = s.rolling( min_periods=N , window=N , center=True ).median().values
+        res['RANGE_%s_%i'%(fname,N)] = res['MAX_%s_%i'%(fname,N)] - res['MIN_%s_%i'%(fname,N)]
+        res['SKEW_%s_%i'%(fname,N)]  = centred( skew )
+        for ifreq in range( powers[N].shape[1] ):
+            res['FFTP_W%i_%s_%i'%(ifreq,fname,N)] = centred( powers[N][:,ifreq] )
+    return pd.DataFrame( res , index=s.index , columns=res.keys() )
+
+def multiscale_fft_powers( d , Ns , freqbins ):
+    # Band powers |rfft| of every length N window for each N in Ns, as
+    # arrays of shape (len(d)-N+1,nbands) indexed by window start. d must
+    # not contain NaN. Bin k of window j is, up to a phase,
+    #     P[j+N] - P[j]  with  P = cumsum( d * exp(-2i*pi*k*m/N) )
+    # so each bin costs a few passes over the data instead of an rfft per
+    # window. Bins at the same frequency k/N are shared by all scales.
+    n = len(d)
+    powers , users = {} , {}
+    for N in Ns:
+        freqiters = get_freqiters( freqbins , N )
+        powers[N] = np.zeros( (max(n-N+1,0),len(freqiters)) )
+        for ifreq,freq in enumerate(freqiters):
+            if freq[1] == 0:
+                # Empty band, NaN as in window_fft_powers
+                powers[N][:,ifreq] = np.nan
+            for k in range( freq[0].start , freq[0].stop ):
+                g = gcd( k , N )
+                users.setdefault( (k//g,N//g) , [] ).append( (N,ifreq,1.0/freq[1]) )
+
+    for (k,N0),uses in users.items():
+        # The phases repeat every N0 samples
+        phase = np.exp( -2j*np.pi * ( k*np.arange(N0) % N0 ) / N0 )
+        P = np.zeros( n+1 , dtype=np.complex128 )
+        np.cumsum( d * np.resize( phase , n ) , out=P[1:] )
+        for N,ifreq,weight in uses:
+            if n < N:
+                continue
+            D = P[N:] - P[:-N]
+            # Faster than np.abs on complex arrays
+            power = D.real*D.real
+            power += D.imag*D.imag
+            np.sqrt( power , out=power )
+            power *= weight
+            powers[N][:,ifreq] += power
+    return powers
+
+def sliding_windows( values , N ):
+    # Read-only strided view of every length N window, shape (len-N+1,N).
+    # No data is copied.
+    values = np.ascontiguousarray( values , dtype=np.float64 )
+    nwin = len(values) - N + 1
+    if nwin <= 0:
+        return np.empty( (0,N) )
+    return np.lib.stride_tricks.as_strided( values , shape=(nwin,N) , strides=(values.strides[0],)*2 , writeable=False )
+
+def window_fft_powers( values , N , freqiters , block=4096 , hop=None ):
+    # Band powers |rfft| of the centred length N window at every row (or
+    # every hop-th row), one column per entry in freqiters. Windows are
+    # transformed in blocks with a single rfft call each, so memory stays
+    # bounded. Rows without a full window of valid values are NaN, as for
+    # rolling( min_periods=N ).
+    hop = 1 if hop is None else hop
+    windows = sliding_windows( values , N )
+    out = np.full( (len(range(0,len(values),hop)),len(freqiters)) , np.nan )
+    # The window starting at row j is centred on row j+N//2, so output
+    # row i (data row i*hop) uses the window starting at i*hop-N//2
+    first = -( -(N//2) // hop )
+    for i in range(first,len(out),block):
+        starts = np.arange( i , min(i+block,len(out)) ) * hop - N//2
+        starts = starts[ starts < len(windows) ]
+        if len(starts) == 0:
+            break
+        if hop == 1:
+            w = windows[ starts[0]:starts[-1]+1 ]
+        else:
+            w = windows[ starts ]
+        spec = np.abs( np.fft.rfft( w , axis=1 ) )
+        for ifreq,freq in enumerate(freqiters):
+            out[i:i+len(spec),ifreq] = spec[:,freq[0]].sum(axis=1) / freq[1]
+    return out
+
+SHAPE_FEATURES = [ 'ZCR' , 'MCR' , 'PEAKS' , 'DOMF' , 'ACLAG' ]
+
+def window_shape_features( values , N , hop=None , block=4096 ):
+    # Per centred length N window (at every row, or every hop-th row):
+    #   ZCR   fraction of neighbouring samples changing sign
+    #   MCR   same for crossings of the window mean
+    #   PEAKS number of local maxima
+    #   DOMF  frequency in Hz of the largest non-DC |rfft| component
+    #   ACLAG lag in s of the highest autocorrelation after it first
+    #         turns negative, i.e. the period of the dominant oscillation
+    # Windows are processed in blocks as whole arrays. Incomplete windows,
+    # and windows without a period for DOMF/ACLAG, give NaN.
+    hop  = 1 if hop is None else hop
+    x    = np.asarray( values , dtype=np.float64 )
+    rows = np.arange( 0 , len(x) , hop )
+    res  = OrderedDict( (k,np.full(len(rows),np.nan)) for k in SHAPE_FEATURES )
+    if len(x) < N:
+        return res
+
+    freq    = np.fft.rfftfreq( N , d=1.0/32.0 )
+    windows = sliding_windows( x , N )
+    starts  = rows - N//2
+    inside  = np.flatnonzero( (starts >= 0) & (starts < len(windows)) )
+    for b in range(0,len(inside),block):
+        sel = inside[b:b+block]
+        w   = windows[ starts[sel] ]
+        good = ~np.isnan(w).any( axis=1 )
+        w , sel = w[good] , sel[good]
+        dev = w - w.mean( axis=1 )[:,None]
+
+        res['ZCR'][sel]   = ( w[:,:-1]*w[:,1:] < 0 ).sum( axis=1 ) / (N-1.0)
+        res['MCR'][sel]   = ( dev[:,:-1]*dev[:,1:] < 0 ).sum( axis=1 ) / (N-1.0)
+        res['PEAKS'][sel] = ( (w[:,1:-1] > w[:,:-2]) & (w[:,1:-1] >= w[:,2:]) ).sum( axis=1 )
+
+        spec = np.abs( np.fft.rfft( dev , axis=1 ) )[:,1:]
+        res['DOMF'][sel] = np.where( spec.max( axis=1 ) > 0 , freq[ 1+spec.argmax( axis=1 ) ] , np.nan )
+
+        # Autocorrelation from the zero padded power spectrum
+        ac  = np.fft.irfft( np.abs( np.fft.rfft( dev , n=2*N , axis=1 ) )**2 , axis=1 )[:,:N//2+1]
+        neg = np.maximum.accumulate( ac < 0 , axis=1 )
+        ac[~neg] = -np.inf
+        lag = ac.argmax( axis=1 )
+        res['ACLAG'][sel] = np.where( neg[:,-1] , lag/32.0 , np.nan )
+    return res
 
 def zero_crosses( s ):
-    n = 0
-    for i in s.index:
-        pass
-        # FIXME
-    return n
+    # Number of sign changes in s, skipping missing values
+    v = s.dropna().values
+    return int( ( v[:-1]*v[1:] < 0 ).sum() )
 
 def get_freqiters( bins , N=160 ):
     freq = np.fft.rfftfreq(N,d=1.0/32.0)[1:]
@@ -96,16 +589,33 @@ def doctor_raw_data( df ):
     # Ensure that all quaternions are unit-normalized
     Quaternions.normalize_df( df )
 
+    # All derived columns are computed on the raw arrays into buffers
+    # allocated once, and attached to df at the end
+    q = [ df[c].values for c in ['Q0','Q1','Q2','Q3'] ]
+    ax , ay , az = [ df[c].values for c in ['AX','AY','AZ'] ]
+    dtype = Quaternions.float_dtype( *( q+[ax,ay,az] ) )
+    new = OrderedDict( (c,np.empty(len(df),dtype)) for c in ['AMAG','ATRAN','PHI','THETA','PSI','AXQ','AYQ','AZQ','ATRANQ','XYANGLE'] )
+
     # Compute acceleration magnitudes and Euler angles
-    df['AMAG']  = np.sqrt( np.power(df['AX'],2) + np.power(df['AY'],2) + np.power(df['AZ'],2) )
-    df['ATRAN'] = np.sqrt( np.power(df['AX'],2) + np.power(df['AY'],2) )
-    df['PHI']   = Quaternions.get_phi( df['Q0'] , df['Q1'] , df['Q2'] , df['Q3'] )
-    df['THETA'] = Quaternions.get_theta( df['Q0'] , df['Q1'] , df['Q2'] , df['Q3'] )
-    df['PSI']   = Quaternions.get_psi( df['Q0'] , df['Q1'] , df['Q2'] , df['Q3'] )
+    # (AMAG holds ay^2 and then az^2 along the way)
+    np.multiply( ax , ax , out=new['ATRAN'] )
+    new['ATRAN'] += np.multiply( ay , ay , out=new['AMAG'] )
+    np.multiply( az , az , out=new['AMAG'] )
+    new['AMAG'] += new['ATRAN']
+    np.sqrt( new['AMAG'] , out=new['AMAG'] )
+    np.sqrt( new['ATRAN'] , out=new['ATRAN'] )
+    Quaternions.get_phi( *q , out=new['PHI'] )
+    Quaternions.get_theta( *q , out=new['THETA'] )
+    Quaternions.get_psi( *q , out=new['PSI'] )
 
     # Compute accelerations rotated into lab reference frame
-    df['AXQ'], df['AYQ'], df['AZQ'] = Quaternions.qv_mult( (df['Q0'],df['Q1'],df['Q2'],df['Q3']) , (df['AX'],df['AY'],df['AZ']) )
-    df['ATRANQ'] = np.sqrt( np.power(df['AXQ'],2) + np.power(df['AYQ'],2) )
+    Quaternions.qv_mult( q , (ax,ay,az) , out=(new['AXQ'],new['AYQ'],new['AZQ']) )
+    np.multiply( new['AXQ'] , new['AXQ'] , out=new['ATRANQ'] )
+    new['ATRANQ'] += np.multiply( new['AYQ'] , new['AYQ'] , out=new['XYANGLE'] )
+    np.sqrt( new['ATRANQ'] , out=new['ATRANQ'] )
 
     # Compute pendulum angle w.r.t. x-y plane (in lab frame)
-    df['XYANGLE'] = Quaternions.get_xyangle( df['Q0'] , df['Q1'] , df['Q2'] , df['Q3'] )
+    Quaternions.get_xyangle( *q , out=new['XYANGLE'] )
+
+    for c,v in new.items():
+        df[c] = v
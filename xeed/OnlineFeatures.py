@@ -0,0 +1,267 @@
+import heapq
+import numpy as np
+import pandas as pd
+from collections import deque
+
+import FeatureExtractor
+
+#
+# Incremental version of FeatureExtractor.add_window_features for streaming
+# data. Every new sample updates running sums (MEAN/STD/SKEW), monotonic
+# deques (MAX/MIN/RANGE), a pair of heaps (MED) and a sliding DFT of the
+# band bins (FFTP) instead of recomputing the full rolling window, e.g.
+#     online = OnlineWindowFeatures( ['AMAG','AZ','ATRAN'] )
+#     for df in follower:
+#         FeatureExtractor.doctor_raw_data( df )
+#         features = online.update( df )
+# The features of a row need the N//2 samples after it (center=True), so
+# each update returns the rows whose windows have just been completed.
+# Missing samples count as NaN, as in limbfeatures. Once a gap is N samples
+# long every window is empty, so the rest of the gap is skipped and the
+# windows start afresh. The rows inside the gap past its first N samples,
+# and the first N-1 rows after it, are therefore not emitted; limbfeatures
+# gives NaN for all of those.
+#
+
+class RunningMedian( object ):
+
+    # Median of a multiset under insertion and removal in O(log N): the
+    # lower half is kept in a max-heap (negated) and the upper half in a
+    # min-heap. Removed values are only marked, and dropped once they reach
+    # the top of a heap, so rebuild() now and then to bound the heap sizes.
+
+    def __init__( self , values=() ):
+        self.rebuild( values )
+
+    def rebuild( self , values ):
+        values = sorted( values )
+        half = ( len(values)+1 ) // 2
+        self.lo = [ -x for x in values[:half] ]
+        self.hi = values[half:]
+        heapq.heapify( self.lo )
+        heapq.heapify( self.hi )
+        self.nlo , self.nhi = len(self.lo) , len(self.hi)
+        self.removed = {}
+
+    def add( self , x ):
+        if self.lo and x <= -self.lo[0]:
+            heapq.heappush( self.lo , -x )
+            self.nlo += 1
+        else:
+            heapq.heappush( self.hi , x )
+            self.nhi += 1
+        self._balance()
+
+    def remove( self , x ):
+        self.removed[x] = self.removed.get( x , 0 ) + 1
+        if self.lo and x <= -self.lo[0]:
+            self.nlo -= 1
+            self._prune( self.lo , -1 )
+        else:
+            self.nhi -= 1
+            self._prune( self.hi , +1 )
+        self._balance()
+
+    def median( self ):
+        if self.nlo > self.nhi:
+            return -self.lo[0]
+        return 0.5 * ( -self.lo[0] + self.hi[0] )
+
+    def _prune( self , heap , sign ):
+        # Drop marked values from the top of heap
+        while heap and self.removed.get( sign*heap[0] ):
+            self.removed[ sign*heap[0] ] -= 1
+            heapq.heappop( heap )
+
+    def _balance( self ):
+        # Keep nlo == nhi or nlo == nhi+1
+        if self.nlo > self.nhi+1:
+            heapq.heappush( self.hi , -heapq.heappop( self.lo ) )
+            self.nlo , self.nhi = self.nlo-1 , self.nhi+1
+            self._prune( self.lo , -1 )
+        elif self.nlo < self.nhi:
+            heapq.heappush( self.lo , -heapq.heappop( self.hi ) )
+            self.nlo , self.nhi = self.nlo+1 , self.nhi-1
+            self._prune( self.hi , +1 )
+
+
+class RunningWindow( object ):
+
+    # Sliding window statistics of a single signal
+
+    def __init__( self , N , freqiters ):
+        self.N         = N
+        self.freqiters = freqiters
+        self.buffer    = np.full( N , np.nan )
+        self.nseen     = 0
+        self.nnan      = N
+        self.median    = RunningMedian()
+        self.maxq      = deque()
+        self.minq      = deque()
+        # Sums are taken relative to a shift value to limit cancellation,
+        # and recomputed from the buffer every N samples to stop drift
+        self.shift     = None
+        self.s1 = self.s2 = self.s3 = 0.0
+
+        # DFT of the buffer at the bins the bands use, with the samples in
+        # slot order. The window in time order is a circular shift of the
+        # buffer, which only changes the phases, so |X| is the same. Each
+        # sample then updates X with one row of the twiddle table, and the
+        # band powers are |X| times a matrix of the band averages.
+        kmin       = min( freq[0].start for freq in freqiters )
+        kmax       = max( freq[0].stop for freq in freqiters )
+        self.twiddle = np.exp( -2j*np.pi * np.outer( np.arange(N) , np.arange(kmin,kmax) ) / N )
+        self.X     = np.zeros( kmax-kmin , dtype=np.complex128 )
+        self.bands = np.zeros( (kmax-kmin,len(freqiters)) )
+        for ifreq,freq in enumerate(freqiters):
+            self.bands[ freq[0].start-kmin : freq[0].stop-kmin , ifreq ] = 1.0 / freq[1]
+
+    def _add( self , x , sign ):
+        d = x - self.shift
+        self.s1 += sign*d
+        self.s2 += sign*d*d
+        self.s3 += sign*d*d*d
+
+    def _resync( self ):
+        # Also rebuilds the median heaps and the DFT, dropping the marked
+        # values and the rounding errors collected since the last resync
+        valid = self.buffer[ ~np.isnan(self.buffer) ]
+        d = valid - self.shift
+        self.s1 , self.s2 , self.s3 = d.sum() , (d*d).sum() , (d*d*d).sum()
+        self.median.rebuild( valid.tolist() )
+        self.X = np.dot( np.nan_to_num( self.buffer ) , self.twiddle )
+
+    def push( self , x ):
+        # Add one sample; returns the feature list for the window ending
+        # here, or None while the first window is still filling up
+        # Plain floats, as numpy scalar arithmetic is slow
+        x    = float( x )
+        i    = self.nseen
+        slot = i % self.N
+        old  = float( self.buffer[slot] )
+        self.buffer[slot] = x
+        self.nseen += 1
+
+        # Missing samples count as 0 in the DFT, their windows give NaN
+        delta = 0.0
+        if old == old:
+            self._add( old , -1 )
+            self.median.remove( old )
+            delta -= old
+        else:
+            self.nnan -= 1
+
+        if x != x:
+            self.nnan += 1
+        else:
+            if self.shift is None:
+                self.shift = x
+            self._add( x , +1 )
+            self.median.add( x )
+            delta += x
+            while self.maxq and self.maxq[-1][1] <= x:
+                self.maxq.pop()
+            while self.minq and self.minq[-1][1] >= x:
+                self.minq.pop()
+            self.maxq.append( (i,x) )
+            self.minq.append( (i,x) )
+        if delta != 0.0:
+            self.X += delta * self.twiddle[slot]
+
+        # Forget extremes that slid out of the window
+        while self.maxq and self.maxq[0][0] <= i-self.N:
+            self.maxq.popleft()
+        while self.minq and self.minq[0][0] <= i-self.N:
+            self.minq.popleft()
+
+        if self.nseen % self.N == 0 and self.shift is not None:
+            self._resync()
+
+        if self.nseen < self.N:
+            return None
+        return self.features()
+
+    def features( self ):
+        # MEAN,STD,MAX,MIN,MED,RANGE,SKEW,FFTP_W* of the current window.
+        # Any NaN in the window gives NaN, like rolling( min_periods=N ).
+        N = self.N
+        if self.nnan > 0:
+            return [ np.nan ] * ( 7+len(self.freqiters) )
+
+        mean = self.shift + self.s1/N
+        var  = ( self.s2 - self.s1*self.s1/N ) / (N-1)
+        std  = np.sqrt( max(var,0.0) )
+
+        A = self.s1/N
+        B = self.s2/N - A*A
+        C = self.s3/N - A*A*A - 3*A*B
+        if B <= 0 or N < 3:
+            skew = np.nan
+        else:
+            skew = ( np.sqrt(N*(N-1.0)) * C ) / ( (N-2) * B**1.5 )
+
+        vmax = self.maxq[0][1]
+        vmin = self.minq[0][1]
+        med  = self.median.median()
+
+        fftp = np.dot( np.abs( self.X ) , self.bands ).tolist()
+
+        return [ mean , std , vmax , vmin , med , vmax-vmin , skew ] + fftp
+
+
+class OnlineWindowFeatures( object ):
+
+    def __init__( self , fnames , N=128 , freqbins=None , fill_gaps=True ):
+        if freqbins is None:
+            freqbins = FeatureExtractor.freqbins
+        self.fnames    = list( fnames )
+        self.N         = N
+        self.freqiters = FeatureExtractor.get_freqiters( freqbins , N )
+        self.windows   = dict( (f,RunningWindow(N,self.freqiters)) for f in self.fnames )
+        self.fill_gaps = fill_gaps
+        self.step      = np.timedelta64( 31250 , 'us' )
+        self.lasttime  = None
+        # Timestamps of the samples in the current window, to label the centres
+        self.times     = deque( maxlen=N )
+
+        # Same names and order as add_window_features
+        self.columns = []
+        for f in self.fnames:
+            self.columns += [ '%s_%s_%i'%(stat,f,N) for stat in ['MEAN','STD','MAX','MIN','MED','RANGE','SKEW'] ]
+            self.columns += [ 'FFTP_W%i_%s_%i'%(ifreq,f,N) for ifreq in range(len(self.freqiters)) ]
+
+    def reset( self ):
+        # Forget the current windows
+        self.windows = dict( (f,RunningWindow(self.N,self.freqiters)) for f in self.fnames )
+        self.times.clear()
+
+    def update( self , df ):
+        # Feed new rows (time ordered, with a DATETIME column or index) and
+        # return the feature rows that became complete, indexed by DATETIME
+        times = df['DATETIME'].values if 'DATETIME' in df else df.index.values
+        values = np.column_stack( [ df[f].values.astype(np.float64) for f in self.fnames ] )
+
+        rows , index = [] , []
+        for t,v in zip( times , values ):
+            # Missing samples on the 31.25 ms grid count as NaN, like the
+            # reindexing in limbfeatures
+            if self.fill_gaps and self.lasttime is not None:
+                nmiss = int( round( (t-self.lasttime) / self.step ) ) - 1
+                for k in range( min(max(nmiss,0),self.N) ):
+                    self._push( self.lasttime + (k+1)*self.step , [np.nan]*len(self.fnames) , rows , index )
+                if nmiss > self.N:
+                    self.reset()
+            self._push( t , v , rows , index )
+            self.lasttime = t
+
+        return pd.DataFrame( rows , index=pd.DatetimeIndex(index,name='DATETIME') , columns=self.columns )
+
+    def _push( self , t , v , rows , index ):
+        self.times.append( t )
+        res = [ self.windows[f].push( x ) for f,x in zip( self.fnames , v ) ]
+        if res[0] is None:
+            return
+        feats = [ x for r in res for x in r ]
+        # The window ending now is centred N//2 samples into it
+        rows  += [ feats ]
+        index += [ self.times[ self.N//2 ] ]
@@ -0,0 +1,138 @@
+import numpy as np
+
+#
+# Quaternion helpers for the xeed orientation data. A quaternion is given
+# as four arrays (or Series) q0,q1,q2,q3, with q0 the scalar part, and is
+# assumed to be unit-normalized. Everything works element-wise on whole
+# arrays: float32 input stays float32, and results can be written into
+# preallocated arrays with out= to avoid temporaries, e.g.
+#     phi = np.empty( n , np.float32 )
+#     Quaternions.get_phi( q0 , q1 , q2 , q3 , out=phi )
+#
+
+QCOLUMNS = [ 'Q0' , 'Q1' , 'Q2' , 'Q3' ]
+
+def float_dtype( *arrays ):
+    # Common floating point type of the inputs (float64 for integers)
+    dtype = np.result_type( *arrays )
+    return dtype if dtype.kind == 'f' else np.dtype( np.float64 )
+
+def _output( out , like , dtype ):
+    if out is None:
+        return np.empty( np.shape(like) , dtype )
+    return out
+
+def _arrays( *xs ):
+    return [ np.asarray( x ) for x in xs ]
+
+def normalize( q0 , q1 , q2 , q3 , out=None ):
+    # Return q/|q|. out is a tuple of four arrays and may be the inputs
+    # themselves to normalize in place.
+    q0 , q1 , q2 , q3 = _arrays( q0 , q1 , q2 , q3 )
+    dtype = float_dtype( q0 , q1 , q2 , q3 )
+    if out is None:
+        out = tuple( np.empty( q0.shape , dtype ) for i in range(4) )
+
+    norm = np.multiply( q0 , q0 , dtype=dtype )
+    tmp  = np.empty_like( norm )
+    for q in (q1,q2,q3):
+        norm += np.multiply( q , q , out=tmp )
+    np.sqrt( norm , out=norm )
+    with np.errstate( invalid='ignore' , divide='ignore' ):
+        for q,o in zip( (q0,q1,q2,q3) , out ):
+            np.divide( q , norm , out=o )
+    return out
+
+def normalize_df( df , columns=QCOLUMNS ):
+    # Unit-normalize the quaternion columns of df in place
+    res = normalize( *[ df[c].values for c in columns ] )
+    for c,v in zip( columns , res ):
+        df[c] = v
+    return df
+
+def get_phi( q0 , q1 , q2 , q3 , out=None ):
+    # Roll angle (about x) in radians
+    q0 , q1 , q2 , q3 = _arrays( q0 , q1 , q2 , q3 )
+    dtype = float_dtype( q0 , q1 , q2 , q3 )
+    out = _output( out , q0 , dtype )
+    # 2(q0q1+q2q3) , 1-2(q1^2+q2^2)
+    num = np.multiply( q0 , q1 , dtype=dtype )
+    num += np.multiply( q2 , q3 , out=out )
+    num *= 2
+    den = _one_minus_twice_squares( q1 , q2 , dtype )
+    return np.arctan2( num , den , out=out )
+
+def get_theta( q0 , q1 , q2 , q3 , out=None ):
+    # Pitch angle (about y) in radians
+    q0 , q1 , q2 , q3 = _arrays( q0 , q1 , q2 , q3 )
+    dtype = float_dtype( q0 , q1 , q2 , q3 )
+    out = _output( out , q0 , dtype )
+    # arcsin( 2(q0q2-q3q1) ), clipped against rounding past +-1
+    tmp = np.multiply( q3 , q1 , dtype=dtype )
+    np.multiply( q0 , q2 , out=out )
+    out -= tmp
+    out *= 2
+    np.clip( out , -1 , 1 , out=out )
+    return np.arcsin( out , out=out )
+
+def get_psi( q0 , q1 , q2 , q3 , out=None ):
+    # Yaw angle (about z) in radians
+    q0 , q1 , q2 , q3 = _arrays( q0 , q1 , q2 , q3 )
+    dtype = float_dtype( q0 , q1 , q2 , q3 )
+    out = _output( out , q0 , dtype )
+    # 2(q0q3+q1q2) , 1-2(q2^2+q3^2)
+    num = np.multiply( q0 , q3 , dtype=dtype )
+    num += np.multiply( q1 , q2 , out=out )
+    num *= 2
+    den = _one_minus_twice_squares( q2 , q3 , dtype )
+    return np.arctan2( num , den , out=out )
+
+def get_xyangle( q0 , q1 , q2 , q3 , out=None ):
+    # Angle of the body z axis above the lab x-y plane in radians, i.e.
+    # arcsin of the lab z component of the rotated body z axis
+    q0 , q1 , q2 , q3 = _arrays( q0 , q1 , q2 , q3 )
+    dtype = float_dtype( q0 , q1 , q2 , q3 )
+    out = _output( out , q0 , dtype )
+    out[...] = _one_minus_twice_squares( q1 , q2 , dtype )
+    np.clip( out , -1 , 1 , out=out )
+    return np.arcsin( out , out=out )
+
+def _one_minus_twice_squares( a , b , dtype ):
+    # 1-2(a^2+b^2) in a new array
+    res = np.multiply( a , a , dtype=dtype )
+    res += np.multiply( b , b , dtype=dtype )
+    res *= -2
+    res += 1
+    return res
+
+def qv_mult( q , v , out=None ):
+    # Rotate the vectors v=(vx,vy,vz) by the quaternions q=(q0,q1,q2,q3),
+    # i.e. q v q*, which takes body frame vectors into the lab frame.
+    # Returns (x,y,z); out may be v itself to rotate in place.
+    q0 , q1 , q2 , q3 = _arrays( *q )
+    vx , vy , vz = _arrays( *v )
+    dtype = float_dtype( q0 , q1 , q2 , q3 , vx , vy , vz )
+    if out is None:
+        out = tuple( np.empty( vx.shape , dtype ) for i in range(3) )
+    ox , oy , oz = out
+
+    # t = 2 (q1,q2,q3) x v
+    tmp = np.empty( vx.shape , dtype )
+    tx = np.multiply( q2 , vz , dtype=dtype )
+    tx -= np.multiply( q3 , vy , out=tmp )
+    tx *= 2
+    ty = np.multiply( q3 , vx , dtype=dtype )
+    ty -= np.multiply( q1 , vz , out=tmp )
+    ty *= 2
+    tz = np.multiply( q1 , vy , dtype=dtype )
+    tz -= np.multiply( q2 , vx , out=tmp )
+    tz *= 2
+
+    # v' = v + q0 t + (q1,q2,q3) x t. Each output component only needs the
+    # same component of v, so writing over v is safe.
+    for o,w,ta,qb,tb,qc,tc in [ (ox,vx,tx,q2,tz,q3,ty) , (oy,vy,ty,q3,tx,q1,tz) , (oz,vz,tz,q1,ty,q2,tx) ]:
+        np.copyto( o , w )
+        o += np.multiply( q0 , ta , out=tmp )
+        o += np.multiply( qb , tb , out=tmp )
+        o -= np.multiply( qc , tc , out=tmp )
+    return out
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+import DataLoader
+
+#
+# Synthetic xeed recordings for testing and benchmarking without real
+# subject data. The signal is a limb swinging like a pendulum at step
+# frequency (orientation quaternions plus gravity and noise in the body
+# frame), so the derived features look like those of a walk.
+#
+
+def synthetic_words( seconds , seed=0 , step_hz=1.8 ):
+    # Return raw uint16 words, shape (seconds*32,7), in Q0..Q3,AX..AZ order
+    rng = np.random.RandomState( seed )
+    t = np.arange( seconds*32 ) / 32.0
+
+    # Swing about the x axis, with a slow drift in heading
+    swing   = 0.5 * np.sin( 2*np.pi*step_hz*t ) + 0.02 * rng.randn( len(t) )
+    heading = 0.1 * np.sin( 2*np.pi*t/60.0 )
+    cs , ss = np.cos(swing/2) , np.sin(swing/2)
+    ch , sh = np.cos(heading/2) , np.sin(heading/2)
+    q = np.column_stack( [ ch*cs , ch*ss , sh*ss , sh*cs ] )
+
+    # Gravity seen from the rotated body frame plus swing acceleration
+    a = np.column_stack( [ 0.3*rng.randn(len(t)) ,
+                           9.81*np.sin(swing) + 2.0*np.cos( 2*np.pi*step_hz*t ) ,
+                           9.81*np.cos(swing) + 0.3*rng.randn(len(t)) ] )
+
+    qw = np.clip( np.round( (q+1.0)*32767.5 ) , 0 , 65535 )
+    aw = np.clip( np.round( (a+30.0)*1092.25 ) , 0 , 65535 )
+    return np.hstack( [qw,aw] ).astype( np.uint16 )
+
+def writeBinFile( path , seconds , start=1476800000 , seed=0 ):
+    # Write a valid .bin recording, one 458-byte packet per second
+    binsecs = np.zeros( seconds , dtype=DataLoader.BINSEC_DTYPE )
+    binsecs['HEADER'] = DataLoader.BINSEC_HEADER
+    binsecs['TIME']   = start + np.arange( seconds )
+    binsecs['WORDS']  = synthetic_words( seconds , seed ).reshape( seconds , 32 , 7 )
+    with open( path , 'wb' ) as f:
+        f.write( binsecs.tostring() )
+    return path
+
+def writeCsvFile( path , seconds , start=1476800000 , seed=0 ):
+    # Write a CSV export with TIME in epoch milliseconds, holding the same
+    # values that writeBinFile would encode
+    words = synthetic_words( seconds , seed ).astype( np.float64 )
+    df = pd.DataFrame( { 'TIME' : start*1000 + ( np.arange(seconds*32) * 31.25 ).astype(np.int64) } )
+    for i,c in enumerate( ['Q0','Q1','Q2','Q3'] ):
+        df[c] = ( words[:,i] / 32767.5 ) - 1.0
+    for i,c in enumerate( ['AX','AY','AZ'] ):
+        df[c] = ( words[:,i+4] / 1092.25 ) - 30.0
+    df.to_csv( path , index=False )
+    return path
@@ -0,0 +1,220 @@
+#!/usr/local/bin/python2
+
+import sys
+import os
+import json
+import time
+import Queue
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import multiprocessing
+import numpy as np
+import pandas
+
+import Tools.Report as report
+
+sys.path.insert( 0 , os.path.join( os.path.dirname(os.path.abspath(__file__)) , 'xeed' ) )
+import DataLoader
+import Synthetic
+
+##################################################################
+###                     BEGIN SOURCE                           ###
+##################################################################
+
+"""
+Benchmark the xeed loading and feature pipeline on synthetic recordings
+(see xeed/Synthetic.py), so that throughput can be tracked without real
+subject data. Every case runs in a fresh child process, which reports the
+wall time and the peak memory of the payload on top of what the process
+held after the setup. Results
+are written as JSON, e.g.
+    ./xeed_Benchmark.py --seconds 60,600,3600 --output Output/xeed_bench.json
+"""
+
+parser = argparse.ArgumentParser( description='Benchmark the xeed pipeline on synthetic data' )
+parser.add_argument( '--seconds' , default='60,600,3600' , help='comma separated recording lengths' )
+parser.add_argument( '--files' , type=int , default=4 , help='number of files for loadPaths' )
+parser.add_argument( '--repeat' , type=int , default=1 , help='runs per case, the fastest is kept' )
+parser.add_argument( '--cases' , default=None , help='comma separated subset of cases to run' )
+parser.add_argument( '--output' , default=None , help='JSON output path' )
+
+
+#
+# Each case has a setup, which is not timed, and a payload taking the
+# setup result. Paths to the synthetic files are passed in via ctx.
+#
+
+def features():
+    import FeatureExtractor
+    return FeatureExtractor
+
+def doctored( ctx ):
+    df = DataLoader.loadPaths( [ctx['bin']] )
+    features().doctor_raw_data( df )
+    return df
+
+def readBin( path ):
+    with open( path , 'rb' ) as f:
+        return DataLoader.loadBinFile( f )
+
+def readCsv( path ):
+    with open( path , 'r' ) as f:
+        return DataLoader.loadCsvFile( f )
+
+def gridded( ctx ):
+    # As limbfeatures feeds add_window_features, on the 31.25 ms grid
+    return features().fill_timeseries( doctored( ctx ) )
+
+cases = [
+    ( 'loadBinFile'         , lambda ctx: ctx['bin'] , readBin ) ,
+    ( 'loadCsvFile'         , lambda ctx: ctx['csv'] , readCsv ) ,
+    ( 'loadPaths'           , lambda ctx: ctx['paths'] , lambda p: DataLoader.loadPaths( list(p) ) ) ,
+    ( 'doctor_raw_data'     , lambda ctx: DataLoader.loadPaths( [ctx['bin']] ) , lambda df: features().doctor_raw_data( df ) ) ,
+    ( 'add_window_features' , gridded , lambda df: features().add_window_features( df , 'AMAG' , 128 , features().freqbins ) ) ,
+    ( 'limbfeatures'        , doctored , lambda df: features().limbfeatures( df ) ) ,
+]
+
+def rows_of( res ):
+    try:
+        return len( res )
+    except TypeError:
+        return None
+
+def current_mb():
+    # Resident set size of this process in MB, None where /proc is missing
+    try:
+        with open( '/proc/self/statm' , 'r' ) as f:
+            return int( f.read().split()[1] ) * resource.getpagesize() / 1048576.0
+    except (IOError,ValueError,IndexError):
+        return None
+
+def maxrss_mb():
+    # Lifetime peak of the resident set size in MB (ru_maxrss is in kB)
+    return resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss / 1024.0
+
+class PeakSampler( threading.Thread ):
+
+    # Polls the resident set size while the payload runs. ru_maxrss alone
+    # can't be used, as it is a lifetime peak and the setup (e.g. loadPaths)
+    # often peaks higher than the payload.
+
+    def __init__( self , interval=0.005 ):
+        threading.Thread.__init__( self )
+        self.daemon   = True
+        self.interval = interval
+        self.peak     = current_mb()
+        self.done     = threading.Event()
+
+    def run( self ):
+        while not self.done.is_set():
+            self.peak = max( self.peak , current_mb() )
+            self.done.wait( self.interval )
+
+    def stop( self ):
+        self.done.set()
+        self.join()
+        self.peak = max( self.peak , current_mb() )
+        return self.peak
+
+def run_case( payload , setup , ctx , queue ):
+    # Executed in the child process
+    try:
+        arg  = setup( ctx )
+        base , maxbase = current_mb() , maxrss_mb()
+        sampler = PeakSampler() if base is not None else None
+        if sampler is not None:
+            sampler.start()
+        start = time.time()
+        res  = payload( arg )
+        stop = time.time()
+        maxpeak = maxrss_mb()
+        if sampler is None:
+            # Without /proc only a rise of the lifetime peak can be seen
+            peak = maxpeak - maxbase
+        else:
+            # A rise of the lifetime peak is exact, the samples may miss
+            # short spikes
+            peak = sampler.stop()
+            if maxpeak > maxbase:
+                peak = max( peak , maxpeak )
+            peak -= base
+        queue.put( { 'time_s' : stop-start , 'peak_mb' : peak , 'rows' : rows_of(res) , 'error' : None } )
+    except Exception as e:
+        queue.put( { 'time_s' : None , 'peak_mb' : None , 'rows' : None , 'error' : '%s: %s' % (type(e).__name__,e) } )
+
+def measure( payload , setup , ctx , poll=1.0 ):
+    queue = multiprocessing.Queue()
+    proc  = multiprocessing.Process( target=run_case , args=(payload,setup,ctx,queue) )
+    proc.start()
+    res = None
+    while res is None:
+        try:
+            res = queue.get( timeout=poll )
+        except Queue.Empty:
+            if proc.is_alive():
+                continue
+            # The child is gone, but its result may still be in the pipe
+            try:
+                res = queue.get( timeout=poll )
+            except Queue.Empty:
+                # e.g. killed for running out of memory
+                if proc.exitcode < 0:
+                    error = 'child killed by signal %i' % -proc.exitcode
+                else:
+                    error = 'child exited with code %i' % proc.exitcode
+                res = { 'time_s' : None , 'peak_mb' : None , 'rows' : None , 'error' : error }
+    proc.join()
+    return res
+
+
+args = parser.parse_args()
+seconds = [ int(s) for s in args.seconds.split(',') ]
+selected = args.cases.split(',') if args.cases else [ c[0] for c in cases ]
+
+results = []
+workdir = tempfile.mkdtemp( prefix='xeed_bench_' )
+try:
+    for nsec in seconds:
+        # Synthetic inputs for this size
+        ctx = { 'bin'   : Synthetic.writeBinFile( os.path.join(workdir,'S00_LA_walk1.bin') , nsec ) ,
+                'csv'   : Synthetic.writeCsvFile( os.path.join(workdir,'S00_LA_walk1.csv') , nsec ) ,
+                'paths' : [ Synthetic.writeBinFile( os.path.join(workdir,'S%02i_LA_walk1.bin'%(i+1)) , nsec , seed=i+1 )
+                            for i in range(args.files) ] }
+
+        for name,setup,payload in cases:
+            if name not in selected:
+                continue
+            runs = [ measure( payload , setup , ctx ) for i in range(args.repeat) ]
+            good = [ r for r in runs if r['error'] is None ]
+            res  = min( good , key=lambda r: r['time_s'] ) if good else runs[0]
+            res.update( { 'case' : name , 'seconds' : nsec } )
+            results += [ res ]
+
+            if res['error'] is None:
+                report.info( '%-20s %6is : %8.3fs %8.1f MB peak' % (name,nsec,res['time_s'],res['peak_mb']) )
+            else:
+                report.warn( '%-20s %6is : %s' % (name,nsec,res['error']) )
+finally:
+    shutil.rmtree( workdir , ignore_errors=True )
+
+output = { 'meta'    : { 'date'     : time.strftime( '%Y-%m-%d %H:%M:%S' ) ,
+                         'host'     : platform.node() ,
+                         'python'   : platform.python_version() ,
+                         'numpy'    : np.__version__ ,
+                         'pandas'   : pandas.__version__ ,
+                         'decoder'  : DataLoader.DECODER_VERSION ,
+                         'files'    : args.files ,
+                         'repeat'   : args.repeat } ,
+           'results' : results }
+
+outpath = args.output or 'Output/xeed_benchmark_%s.json' % time.strftime( '%Y%m%d_%H%M%S' )
+if os.path.dirname( outpath ) and not os.path.isdir( os.path.dirname(outpath) ):
+    os.makedirs( os.path.dirname(outpath) )
+with open( outpath , 'w' ) as f:
+    json.dump( output , f , indent=2 , sort_keys=True )
+
+report.info( 'Benchmark results written to %s' % outpath )